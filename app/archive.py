@@ -0,0 +1,111 @@
+import asyncio
+import fcntl
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+# ------------------- ALERT ARCHIVE -------------------
+# Replied alerts older than the retention period are moved out of the live
+# store into append-only daily segments: <archive_dir>/alerts-YYYY-MM-DD.jsonl.gz
+# (one JSON object per line, keyed by the alert's own date). Each run appends
+# a new gzip member, which gzip readers treat as one continuous stream.
+
+SEGMENT_PREFIX = "alerts-"
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+# VACUUM the live DB when a run removes at least this share of its rows
+VACUUM_RATIO = 0.2
+
+
+def segment_path(archive_dir, day):
+    return os.path.join(archive_dir, f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}")
+
+
+def segment_day(path):
+    name = os.path.basename(path)
+    return name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+
+
+def append_segments(archive_dir, items):
+    """Append (key, entry) pairs to their daily segments and fsync them.
+    Returns the number of records written."""
+    os.makedirs(archive_dir, exist_ok=True)
+
+    by_day = {}
+    for key, entry in items:
+        day = (entry.get("time") or "unknown")[:10]
+        by_day.setdefault(day, []).append(dict(entry, key=key))
+
+    for day, records in by_day.items():
+        path = segment_path(archive_dir, day)
+        with open(path, "ab") as raw:
+            # Shards archive from separate processes (see app/shard.py)
+            fcntl.flock(raw, fcntl.LOCK_EX)
+            with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                for record in records:
+                    gz.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+    return sum(len(r) for r in by_day.values())
+
+
+def list_segments(archive_dir, since=None):
+    """Segment files in date order, optionally only from `since` (a date)."""
+    paths = sorted(glob.glob(os.path.join(archive_dir, f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")))
+    if since is not None:
+        since = since.isoformat()
+        paths = [p for p in paths if segment_day(p) >= since]
+    return paths
+
+
+def iter_archive(archive_dir, since=None):
+    """Yield archived alerts one at a time, oldest segment first."""
+    for path in list_segments(archive_dir, since):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def index_archive(store, archive_dir, chunk=1000):
+    """One-time backfill of the search index from the archive segments,
+    `chunk` records at a time so memory stays flat. Blocking; no-op once it
+    has completed for this search database."""
+    if not store.search_path or store.search_flag("indexed_archive"):
+        return 0
+    count = 0
+    batch = []
+    for record in iter_archive(archive_dir):
+        key = record.pop("key", None)
+        if key is None:
+            continue
+        batch.append((key, record))
+        if len(batch) >= chunk:
+            store.index_archived(batch)
+            count += len(batch)
+            batch = []
+    store.index_archived(batch, done_flag="indexed_archive")
+    return count + len(batch)
+
+
+# ------------------- RETENTION JOB -------------------
+async def archive_old_alerts(store, archive_dir, days, status="replied"):
+    """Move alerts with `status` older than `days` days from the live store
+    to the archive, then compact the database. Returns how many moved."""
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    items = store.older_than(status, cutoff)
+    if not items:
+        return 0
+    total = store.count()
+
+    # Archive first: if we crash before the delete is flushed, the alerts
+    # are archived again next run (duplicates) rather than lost.
+    await asyncio.to_thread(append_segments, archive_dir, items)
+    store.delete_keys((key for key, _ in items), archived=True)
+    await store.flush()
+    # Rewriting the file is only worth it when a good share of it went away
+    vacuum = len(items) >= total * VACUUM_RATIO
+    await asyncio.to_thread(store.store.compact, vacuum)
+    return len(items)
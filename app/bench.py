@@ -0,0 +1,398 @@
+"""
+Offline load test for the handler pipeline.
+
+    python -m app.bench
+    python -m app.bench --sizes 100,1000,10000,100000 --updates 2000
+    python -m app.bench --replay updates.jsonl   # one Update JSON per line
+
+Updates are fed through the real Application built by app.bot.build_app(),
+so every handler group runs exactly as in production. HTTPXRequest is
+replaced by a stub that answers every Bot API call locally, and the alert
+DB lives in a temp directory, so nothing touches the network or app/.
+
+For each alert history size it reports throughput, p50/p99 latency per
+update kind, time spent flushing the DB, and memory (peak RSS, or Python
+heap with --trace-memory, which slows everything down noticeably).
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BENCH_BOSS_ID = 1000
+BENCH_GROUP_ID = 2000
+
+# Must be set before app.config is imported
+os.environ["BOT_TOKEN"] = os.environ.get("BENCH_BOT_TOKEN", "123456:bench")
+os.environ["BOSS_ID"] = str(BENCH_BOSS_ID)
+os.environ["GROUP_ID"] = str(BENCH_GROUP_ID)
+os.environ["LEGACY_DB_FILE"] = ""
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.pop("TELEGRAM_BASE_URL", None)
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+
+# ------------------- STUB REQUEST -------------------
+class StubRequest(BaseRequest):
+    """Answers Bot API calls without any network I/O."""
+
+    def __init__(self):
+        self.calls = {}
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, chat_id):
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            "text": "",
+        }
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif api_method in ("sendMessage", "editMessageText", "forwardMessage", "copyMessage"):
+            result = self._message(params.get("chat_id"))
+        elif api_method in ("forwardMessages", "copyMessages"):
+            result = [{"message_id": m} for m in params.get("message_ids", [])]
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# ------------------- SYNTHETIC DATA -------------------
+WORDS = "hello team today meeting report ok thanks check update later deploy fix".split()
+TRIGGER_TEXTS = ["the plan for tomorrow", "production is down", "operation starts at 9"]
+
+
+def _user(user_id, name):
+    return {"id": user_id, "is_bot": False, "first_name": name}
+
+
+def _group(chat_id):
+    return {"id": chat_id, "type": "supergroup", "title": f"group {chat_id}"}
+
+
+def seed_entries(n, rng):
+    """n alerts spread over the last 30 days, mostly replied."""
+    now = datetime.now()
+    entries = {}
+    for i in range(n):
+        group_id = -1001000000000 - (i % 50)
+        entries[f"{group_id}_{i}"] = {
+            "group_id": group_id,
+            "group_title": f"group {i % 50}",
+            "group_username": "",
+            "message_id": i,
+            "text": " ".join(rng.choices(WORDS, k=12)),
+            "sender": f"user {i % 200}",
+            "time": (now - timedelta(minutes=rng.randrange(30 * 24 * 60))).isoformat(),
+            "status": rng.choices(("replied", "pending", "ignored"), (6, 3, 1))[0],
+        }
+    return entries
+
+
+class UpdateFactory:
+    """Mix of update kinds roughly like a busy day."""
+
+    KINDS = (
+        ("group_text", 55),
+        ("group_trigger", 20),
+        ("button", 10),
+        ("private_reply", 5),
+        ("voice", 5),
+        ("summary", 5),
+    )
+
+    def __init__(self, bot, store, rng):
+        self.bot = bot
+        self.store = store
+        self.rng = rng
+        self.update_id = 0
+        self.message_id = 10_000_000
+        self.kinds, self.weights = zip(*self.KINDS)
+
+    def _next_ids(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    def _message(self, chat, user, **fields):
+        update_id, message_id = self._next_ids()
+        msg = {"message_id": message_id, "date": int(time.time()), "chat": chat, "from": user}
+        msg.update(fields)
+        return {"update_id": update_id, "message": msg}
+
+    def _pending_key(self):
+        count = self.store.count_status("pending")
+        if not count:
+            return "0_0"
+        i = self.rng.randrange(count)
+        entry = self.store.status_slice("pending", i, i + 1)[0]
+        return f"{entry['group_id']}_{entry['message_id']}"
+
+    def make(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        chat_id = -1001000000000 - self.rng.randrange(50)
+        user = _user(10 + self.rng.randrange(200), "member")
+        boss = _user(BENCH_BOSS_ID, "boss")
+
+        if kind == "group_text":
+            data = self._message(_group(chat_id), user, text=" ".join(self.rng.choices(WORDS, k=10)))
+        elif kind == "group_trigger":
+            data = self._message(_group(chat_id), user, text=self.rng.choice(TRIGGER_TEXTS))
+        elif kind == "voice":
+            data = self._message(
+                _group(chat_id), user,
+                voice={"file_id": "v", "file_unique_id": "v", "duration": 3},
+            )
+        elif kind == "private_reply":
+            from app import bot as bot_module
+            bot_module.reply_map[BENCH_BOSS_ID] = self._pending_key()
+            private = {"id": BENCH_BOSS_ID, "type": "private", "first_name": "boss"}
+            data = self._message(private, boss, text="on it")
+        elif kind == "summary":
+            private = {"id": BENCH_BOSS_ID, "type": "private", "first_name": "boss"}
+            data = self._message(
+                private, boss, text="/summary",
+                entities=[{"type": "bot_command", "offset": 0, "length": 8}],
+            )
+        else:  # button
+            update_id, message_id = self._next_ids()
+            action = self.rng.choice(("toggle", "ignore"))
+            data = {
+                "update_id": update_id,
+                "callback_query": {
+                    "id": str(update_id),
+                    "from": boss,
+                    "chat_instance": "bench",
+                    "data": f"{action}|{self._pending_key()}",
+                    "message": {
+                        "message_id": message_id,
+                        "date": int(time.time()),
+                        "chat": {"id": BENCH_BOSS_ID, "type": "private"},
+                        "text": "alert",
+                    },
+                },
+            }
+        return kind, Update.de_json(data, self.bot)
+
+
+def _kind_of(update):
+    if update.callback_query:
+        return "button"
+    msg = update.effective_message
+    if msg is None:
+        return "other"
+    if msg.chat.type == "private":
+        return "summary" if (msg.text or "").startswith("/") else "private_reply"
+    return "voice" if msg.voice else "group_text"
+
+
+# ------------------- RUN -------------------
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_size(size, n_updates, replay, workdir, seed, trace_memory=False):
+    from app import bot as bot_module
+    from app.coalesce import Coalescer
+    from app.follow import MediaFollow
+    from app.outbox import Outbox
+    from app.sender import SendQueue
+    from app.storage import AlertCache, AlertStore
+
+    rng = random.Random(seed)
+    result = {"size": size}
+
+    if trace_memory:
+        tracemalloc.start()
+
+    # Seed the history straight into SQLite, then time loading it back
+    db_path = os.path.join(workdir, f"alerts_{size}.db")
+    raw = AlertStore(db_path, search_path=os.path.join(workdir, f"search_{size}.db"))
+    t = time.perf_counter()
+    raw.write_batch(seed_entries(size, rng))
+    result["seed_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    store = AlertCache(raw, flush_interval=3600, max_dirty=10**9)
+    result["load_s"] = time.perf_counter() - t
+
+    bot_module.store = store
+    bot_module.reply_map.clear()
+    bot_module.sender = SendQueue(global_rate=1e9, chat_rate=1e9, chat_burst=10**9)
+    bot_module.follow = MediaFollow(
+        bot_module.sender, bot_module.follow.windows, album_delay=bot_module.follow.album_delay
+    )
+    bot_module.outbox = Outbox(os.path.join(workdir, f"outbox_{size}.db"))
+    bot_module.coalescer = Coalescer(
+        bot_module.sender,
+        window=bot_module.COALESCE_WINDOW,
+        edit_delay=bot_module.COALESCE_EDIT_DELAY,
+    )
+
+    request = StubRequest()
+    app = bot_module.build_app(request=request)
+    await app.initialize()
+    bot_module.sender.start()
+
+    factory = UpdateFactory(app.bot, store, rng)
+    latencies = {}
+    flush_s = 0.0
+    flushes = 0
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        for i in range(n_updates):
+            if replay:
+                update = Update.de_json(replay[i % len(replay)], app.bot)
+                kind = _kind_of(update)
+            else:
+                kind, update = factory.make()
+
+            t = time.perf_counter()
+            await app.process_update(update)
+            latencies.setdefault(kind, []).append(time.perf_counter() - t)
+
+            if store.pending_writes() >= 100:
+                t = time.perf_counter()
+                await store.flush()
+                flush_s += time.perf_counter() - t
+                flushes += 1
+
+        t = time.perf_counter()
+        await store.flush()
+        flush_s += time.perf_counter() - t
+        flushes += 1
+        elapsed = time.perf_counter() - started
+
+        # Daily summary over the whole history
+        class _Job:
+            bot = app.bot
+            job = None
+
+        t = time.perf_counter()
+        await bot_module.daily_summary(_Job())
+        latencies["daily_summary"] = [time.perf_counter() - t]
+
+        await bot_module.coalescer.close()
+        await bot_module.follow.close()
+        await bot_module.sender.close()
+        bot_module.outbox.close()
+
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        # ru_maxrss is in KiB on Linux
+        current = peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    await app.shutdown()
+    raw.close()
+
+    result.update(
+        updates=n_updates,
+        elapsed_s=elapsed,
+        throughput=n_updates / elapsed if elapsed else 0.0,
+        flush_s=flush_s,
+        flushes=flushes,
+        mem_current_mb=current / 2**20,
+        mem_peak_mb=peak / 2**20,
+        api_calls=dict(request.calls),
+        latency_ms={
+            kind: {
+                "n": len(v),
+                "p50": _percentile(v, 50) * 1000,
+                "p99": _percentile(v, 99) * 1000,
+                "mean": statistics.fmean(v) * 1000,
+            }
+            for kind, v in sorted(latencies.items())
+        },
+    )
+    return result
+
+
+def print_result(r):
+    print(
+        f"\n=== history {r['size']:,} alerts ===\n"
+        f"seed {r['seed_s']:.2f}s  load {r['load_s']:.3f}s  "
+        f"mem {r['mem_current_mb']:.1f} MB (peak {r['mem_peak_mb']:.1f} MB)\n"
+        f"{r['updates']} updates in {r['elapsed_s']:.2f}s -> {r['throughput']:.0f} updates/s\n"
+        f"DB flush {r['flush_s'] * 1000:.1f} ms over {r['flushes']} flushes\n"
+        f"API calls: {r['api_calls']}"
+    )
+    print(f"{'kind':<16}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for kind, s in r["latency_ms"].items():
+        print(f"{kind:<16}{s['n']:>7}{s['p50']:>10.3f}{s['p99']:>10.3f}{s['mean']:>10.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,100000",
+                        help="comma-separated alert history sizes")
+    parser.add_argument("--updates", type=int, default=2000,
+                        help="updates replayed per history size")
+    parser.add_argument("--replay", help="JSONL file of recorded Update payloads")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure Python heap with tracemalloc instead of RSS")
+    parser.add_argument("--json", dest="json_out", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    replay = None
+    if args.replay:
+        with open(args.replay) as f:
+            replay = [json.loads(line) for line in f if line.strip()]
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+        os.environ["DB_FILE"] = os.path.join(workdir, "alerts.db")
+        os.environ["STATE_FILE"] = os.path.join(workdir, "state.json")
+        os.environ["SEARCH_DB_FILE"] = os.path.join(workdir, "search.db")
+        os.environ["OUTBOX_FILE"] = os.path.join(workdir, "outbox.db")
+        for size in sizes:
+            r = asyncio.run(
+                run_size(size, args.updates, replay, workdir, args.seed, args.trace_memory)
+            )
+            print_result(r)
+            results.append(r)
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,20 @@
-import json
-import os
+import asyncio
+import logging
+import sqlite3
+import tempfile
 from datetime import datetime, time
+from zoneinfo import ZoneInfo
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
 from telegram.ext import (
     ApplicationBuilder,
     MessageHandler,
-    filters,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
 )
-from telegram.request import HTTPXRequest
 
 # ------------------- CONFIG -------------------
 # app.config should define:
@@ -24,26 +27,212 @@ from app.config import (
     TRIGGERS_TO_BOSS,
     TRIGGERS_TO_GROUP,
     ROUTES,
+    TRIGGER_WORD_BOUNDARY,
+    TRIGGER_CASEFOLD,
+    DB_FLUSH_INTERVAL,
+    DB_FLUSH_MAX_DIRTY,
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SEND_WORKERS,
+    BOT_MODE,
+    CONCURRENT_UPDATES,
+    TELEGRAM_BASE_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    DB_FILE,
+    LEGACY_DB_FILE,
+    RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    ARCHIVE_DIR,
+    EXPORT_MAX_MB,
+    STATE_FILE,
+    STATE_MAX_ENTRIES,
+    REPLY_MODE_TTL,
+    VOICE_FOLLOW_WINDOW,
+    FOLLOW_MEDIA,
+    FOLLOW_WINDOWS,
+    ALBUM_DELAY,
+    SHARDS,
+    SHARD_INDEX,
+    STATE_SAVE_INTERVAL,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_DEBUG_SAMPLE,
+    METRICS_HOST,
+    METRICS_PORT,
+    COALESCE_WINDOW,
+    COALESCE_WINDOWS,
+    COALESCE_EDIT_DELAY,
+    CHAT_ROUTES,
+    BOSS_USERNAMES,
+    ROUTING_FILE,
+    ROUTING_WATCH_INTERVAL,
+    SEARCH_DB_FILE,
+    DAILY_SUMMARY_TIME,
+    DAILY_SUMMARY_TZ,
+    SUMMARY_CONCURRENCY,
+    SUMMARY_SCHEDULES,
+    OUTBOX_FILE,
+    OUTBOX_KEEP_HOURS,
 )
+from app import metrics
+from app.archive import archive_old_alerts, index_archive
+from app.export import FORMATS, export_filename, iter_alerts, write_export
+from app.coalesce import Coalescer
+from app.sender import PRIORITY_BOSS, PRIORITY_DIGEST, PRIORITY_GROUP, SendQueue
+from app.locks import KeyedLocks
+from app.log import Lazy, setup_logging
+from app.dispatch import GROUP_TEXT, ChatOrderedProcessor, group_media, reply_filter
+from app.follow import MediaFollow, media_filter
+from app.http import build_requests_from_config
+from app.outbox import Outbox, alert_payload, forward_payload, perform
+from app.metrics import (
+    ALERTS,
+    ALERTS_COALESCED,
+    TRIGGER_HITS,
+    Gauge,
+    record_update_lag,
+    timed,
+)
+from app.routing import file_mtime, load_routing
+from app.search import parse_query, parse_since
+from app.shard import owns_key
+from app.storage import AlertCache, AlertStore
+from app.summary import (
+    PAGE_SIZE,
+    SECTIONS,
+    SummaryView,
+    message_link,
+    page_count,
+    page_keyboard,
+    render_page,
+    render_search_page,
+    split_by_destination,
+)
+from app.ttlmap import TTLMap, load_snapshot, snapshot_maps, write_snapshot
 
+# Set up logging first so messages from the store setup below are kept
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE)
+log = logging.getLogger(__name__)
 
-DB_FILE = "app/db.json"
+SUMMARY_TITLE = "Summary — Pending & Ignored Messages"
+DAILY_SUMMARY_TITLE = "Daily Summary — Pending & Ignored Messages"
 
 # key = user_id (boss or alert group admin), value = message key in DB
-reply_map = {}
-last_triggered_users = {}
+reply_map = TTLMap(REPLY_MODE_TTL, max_size=STATE_MAX_ENTRIES)
+# key = user_id, value = last /search query (for the page buttons)
+search_queries = TTLMap(REPLY_MODE_TTL, max_size=100)
+
+# Locks per alert key / per user, used where a handler awaits between reading
+# and writing shared state (updates may be processed concurrently)
+alert_locks = KeyedLocks()
+user_locks = KeyedLocks()
+
+# ------------------- SHARDING -------------------
+# In sharded mode (app/shard.py) this process is one of SHARDS workers and
+# only sees its own chats. Worker 0 answers the global commands and sends
+# the daily summaries.
+sharded = SHARD_INDEX is not None
+control = SHARD_INDEX in (None, 0)
+
+# ------------------- DATABASE -------------------
+# Handlers read and write the in-memory cache; a background task flushes
+# changes to SQLite (see post_init / post_shutdown below)
+store = AlertCache(
+    AlertStore(DB_FILE, legacy_json=LEGACY_DB_FILE, search_path=SEARCH_DB_FILE or None),
+    flush_interval=DB_FLUSH_INTERVAL,
+    max_dirty=DB_FLUSH_MAX_DIRTY,
+    owns=owns_key(SHARD_INDEX, SHARDS) if sharded else None,
+)
+# One-time search backfill of the archive (see post_init)
+index_task = None
+
+# ------------------- OUTBOX -------------------
+# Alert sends and reply forwards are recorded before they are attempted, so a
+# crash can't lose them (see app/outbox.py and replay_outbox below)
+outbox = Outbox(OUTBOX_FILE)
+
+# ------------------- OUTBOUND QUEUE -------------------
+# Alerts are queued and sent by background workers (see app/sender.py)
+sender = SendQueue(
+    global_rate=SEND_GLOBAL_RATE,
+    chat_rate=SEND_CHAT_RATE,
+    chat_burst=SEND_CHAT_BURST,
+    workers=SEND_WORKERS,
+)
+
+# Repeated triggers from one chat are merged into one live-updated alert
+coalescer = Coalescer(
+    sender,
+    window=COALESCE_WINDOW,
+    windows=COALESCE_WINDOWS,
+    edit_delay=COALESCE_EDIT_DELAY,
+)
+
+# Media posted by a trigger's sender shortly after is forwarded too
+follow = MediaFollow(
+    sender,
+    {t: FOLLOW_WINDOWS.get(t, VOICE_FOLLOW_WINDOW) for t in FOLLOW_MEDIA},
+    album_delay=ALBUM_DELAY,
+    max_size=STATE_MAX_ENTRIES,
+)
+
+# ------------------- METRICS -------------------
+# Scraped from http://METRICS_HOST:METRICS_PORT/metrics (see app/metrics.py)
+metrics_server = None
+Gauge("bot_send_queue_depth", "Alerts waiting in the outbound queue", lambda: sender.depth())
+Gauge("bot_send_flood_waits", "RetryAfter responses seen by the send queue", lambda: sender.flood_waits)
+Gauge("bot_alerts_stored", "Alerts in the live store", lambda: store.count())
+Gauge("bot_db_pending_writes", "Alert changes not yet flushed to disk", lambda: store.pending_writes())
+Gauge("bot_reply_mode_users", "Users currently in reply mode", lambda: len(reply_map))
+
+# ------------------- ROUTING -------------------
+# Per-group trigger rules and destinations, compiled up front (see
+# app/routing.py). Values in ROUTING_FILE replace the ones from app/config.py.
+# Handlers read `routing` once per message; a reload compiles a new table in
+# a worker thread and swaps it in with one assignment, so a message never
+# sees a half-updated view.
+ROUTING_DEFAULTS = {
+    "routes": ROUTES,
+    "to_boss": TRIGGERS_TO_BOSS,
+    "to_group": TRIGGERS_TO_GROUP,
+    "boss_usernames": BOSS_USERNAMES,
+    "chats": CHAT_ROUTES,
+}
+
+
+def _load_routing():
+    return load_routing(
+        ROUTING_FILE,
+        ROUTING_DEFAULTS,
+        boss_chat=BOSS_ID,
+        group_chat=ALERT_GROUP_ID,
+        word_boundary=TRIGGER_WORD_BOUNDARY,
+        casefold=TRIGGER_CASEFOLD,
+    )
 
-# ------------------- DATABASE HELPERS -------------------
-def load_db():
-    if not os.path.exists(DB_FILE):
-        return {}
-    with open(DB_FILE, "r") as f:
-        return json.load(f)
 
+# A broken routing file at startup is a hard error; on reload it's reported
+# and the current table stays in use
+routing, routing_mtime = _load_routing()
+routing_lock = asyncio.Lock()
 
-def save_db(db):
-    with open(DB_FILE, "w") as f:
-        json.dump(db, f, indent=4)
+
+async def reload_routing():
+    """Re-read ROUTING_FILE and swap in the new table. Raises on a bad file
+    (OSError / ValueError), leaving the current table in place."""
+    global routing, routing_mtime
+    async with routing_lock:
+        # Remember the file version even if it fails, so the watcher
+        # doesn't retry the same broken file every few seconds
+        routing_mtime = file_mtime(ROUTING_FILE)
+        routing, routing_mtime = await asyncio.to_thread(_load_routing)
+    log.info("Routing reloaded: %d group rule(s)", len(routing.chats))
+    return routing
 
 
 # ------------------- COMMANDS -------------------
@@ -51,83 +240,142 @@ async def start(update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("✅ Bot is running successfully.")
 
 
-async def manual_summary(update, context: ContextTypes.DEFAULT_TYPE):
-    """Boss can type /summary to see pending & ignored messages in a clean format."""
-    db = load_db()
-    pending = []
-    ignored = []
-
-    for entry in db.values():
-        status = entry.get("status")
-        if status == "pending":
-            pending.append(entry)
-        elif status == "ignored":
-            ignored.append(entry)
-
-    if not pending and not ignored:
+async def queue_status(update, context: ContextTypes.DEFAULT_TYPE):
+    """Boss can type /queue to see the outbound alert queue."""
+    if update.effective_user.id != BOSS_ID:
+        return
+
+    stats = sender.stats()
+    shard = f" (worker {SHARD_INDEX + 1}/{SHARDS})" if sharded else ""
+    await update.message.reply_text(
+        f"📤 Outbound queue{shard}\n"
+        f"Waiting: {stats['depth']} ({stats['deferred']} held by rate limits)\n"
+        f"Sent: {stats['sent']}  Retried: {stats['retried']}  Dropped: {stats['dropped']}\n"
+        f"Flood waits: {stats['flood_waits']}  Paused chats: {stats['paused_chats']}"
+    )
+
+
+async def reload_config(update, context: ContextTypes.DEFAULT_TYPE):
+    """Boss can type /reload to re-read the trigger/routing file."""
+    if update.effective_user.id != BOSS_ID:
+        return
+
+    try:
+        table = await reload_routing()
+    except (OSError, ValueError) as e:
+        if control:
+            await update.message.reply_text(f"❌ Config not reloaded, keeping the old one:\n{e}")
+        return
+    if not control:
+        # Every worker reloads; worker 0 answers
+        return
+    await update.message.reply_text(
+        f"🔄 Config reloaded: {len(table.chats)} group rule(s)"
+        + ("" if routing_mtime is not None else " (no routing file, using app/config.py)")
+    )
+
+
+async def _search_page(query, page):
+    """(text, keyboard) for one page of /search results."""
+    match, since = parse_query(query)
+    # Make sure alerts from the last few seconds are in the index
+    await store.flush()
+    total, results = await asyncio.to_thread(
+        store.store.search, match, since, PAGE_SIZE, page * PAGE_SIZE
+    )
+    pages = max(1, -(-total // PAGE_SIZE))
+    if page >= pages:
+        page = pages - 1
+        total, results = await asyncio.to_thread(
+            store.store.search, match, since, PAGE_SIZE, page * PAGE_SIZE
+        )
+    text = render_search_page(query, results, total, page, pages)
+    return text, page_keyboard(page, pages, action="search")
+
+
+async def search(update, context: ContextTypes.DEFAULT_TYPE):
+    """Boss can type /search <words> [from:sender] [group:title] [since:date]
+    to search every stored and archived alert."""
+    if update.effective_user.id != BOSS_ID:
+        return
+    if not store.store.search_path:
+        await update.message.reply_text("🔎 Search is turned off (SEARCH_DB_FILE).")
+        return
+
+    query = " ".join(context.args)
+    try:
+        text, kb = await _search_page(query, 0)
+    except (ValueError, sqlite3.OperationalError) as e:
         await update.message.reply_text(
-            "📊 No pending or ignored messages.",
-            parse_mode="Markdown",
+            f"🔎 Usage: /search <words> [from:sender] [group:title] [since:2024-05-01]\n({e})"
         )
         return
 
-    def build_section(title, items):
-        if not items:
-            return f"*{title}*\n_No messages._\n\n"
+    search_queries[update.effective_user.id] = query
+    await update.message.reply_text(text, reply_markup=kb, disable_web_page_preview=True)
 
-        try:
-            items.sort(key=lambda e: datetime.fromisoformat(e["time"]))
-        except Exception:
-            pass
-
-        text = f"*{title}*\n"
-        for e in items:
-            try:
-                dt = datetime.fromisoformat(e["time"])
-                time_str = dt.strftime("%Y-%m-%d %H:%M")
-            except Exception:
-                time_str = e.get("time", "Unknown time")
-
-            group_title = e.get("group_title", "group")
-            sender = e.get("sender", "Unknown")
-            preview = (e.get("text") or "").replace("\n", " ")[:80]
-
-            group_username = e.get("group_username")
-            group_id = e.get("group_id")
-            message_id = e.get("message_id")
-
-            if group_username:
-                open_link = f"tg://resolve?domain={group_username}&post={message_id}"
-            elif str(group_id).startswith("-100"):
-                chat_id_for_link = str(group_id)[4:]
-                open_link = f"https://t.me/c/{chat_id_for_link}/{message_id}"
-            else:
-                open_link = f"Message ID: `{message_id}`"
 
-            text += (
-                f"- `[{time_str}]` *{group_title}* — *{sender}*\n"
-                f"  {preview}...\n"
-            )
+async def export(update, context: ContextTypes.DEFAULT_TYPE):
+    """Boss can type /export [since] [status] [csv] to get the alert history
+    (live and archived) as a gzipped JSONL or CSV file."""
+    if update.effective_user.id != BOSS_ID:
+        return
 
-            if open_link.startswith("http") or open_link.startswith("tg://"):
-                text += f"  [Open message]({open_link})\n\n"
+    since = status = None
+    fmt = "jsonl"
+    try:
+        for arg in context.args:
+            if arg.lower() in FORMATS:
+                fmt = arg.lower()
+            elif arg.lower() in ("pending", "ignored", "replied"):
+                status = arg.lower()
             else:
-                text += f"  {open_link}\n\n"
-
-        return text
-
-    msg = "📊 *Summary — Pending & Ignored Messages*\n\n"
-    msg += build_section("⏳ Pending", pending)
-    msg += build_section("🚫 Ignored", ignored)
+                since = parse_since(arg)
+    except ValueError as e:
+        await update.message.reply_text(
+            f"📦 Usage: /export [since: 2024-05-01|7d] [pending|ignored|replied] [csv]\n({e})"
+        )
+        return
 
+    await store.flush()
+    # Written to a temp file from a worker thread; rows are streamed from
+    # SQLite and the archive, never all held in memory. Sending it does read
+    # the compressed file into memory, hence EXPORT_MAX_MB.
+    with tempfile.TemporaryFile() as f:
+        count = await asyncio.to_thread(
+            write_export, iter_alerts(store.store, ARCHIVE_DIR, since, status), f, fmt
+        )
+        size = f.tell()
+        if size > EXPORT_MAX_MB * 1024 * 1024:
+            await update.message.reply_text(
+                f"📦 {count} alerts make a {size / 1024 / 1024:.1f} MB file, over the "
+                f"{EXPORT_MAX_MB} MB limit. Narrow it down with a later date or a "
+                "status, or run python -m app.export on the server."
+            )
+            return
+        f.seek(0)
+        await update.message.reply_document(
+            document=f,
+            filename=export_filename(fmt, since, status),
+            caption=f"📦 {count} alerts",
+        )
 
-    MAX_LEN = 4000  # a bit under Telegram's 4096 limit
 
-    if len(msg) > MAX_LEN:
-        msg = msg[:MAX_LEN - 50] + "\n\n... truncated, too many items."
+async def manual_summary(update, context: ContextTypes.DEFAULT_TYPE):
+    """Boss can type /summary to see pending & ignored messages in a clean format.
+    Long summaries are paged with Prev/Next buttons."""
+    view = await _summary_source()
+    if not view.count_status("pending") and not view.count_status("ignored"):
+        await update.message.reply_text(
+            "📊 No pending or ignored messages.",
+            parse_mode="Markdown",
+        )
+        return
 
+    text, page, pages = render_page(view, SUMMARY_TITLE)
     await update.message.reply_text(
-        msg,
+        text,
+        reply_markup=page_keyboard(page, pages),
         disable_web_page_preview=True,
     )
 
@@ -138,34 +386,22 @@ async def clear_today(update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != BOSS_ID:
         return
 
-    db = load_db()
-    if not db:
+    today = datetime.now().date()
+    if sharded:
+        # Every worker clears its own chats; worker 0 answers for all of
+        # them with the count from the shared DB
+        total = 0
+        if control:
+            await store.flush()
+            total = await asyncio.to_thread(store.store.count_day, today)
+        removed = max(store.delete_day(today), total)
+        if not control:
+            return
+    elif store.count() == 0:
         await update.message.reply_text("🧹 Nothing to clear.")
         return
-
-    today = datetime.now().date()
-    new_db = {}
-    removed = 0
-
-    for key, entry in db.items():
-        status = entry.get("status")
-        t_str = entry.get("time")
-
-        try:
-            dt = datetime.fromisoformat(t_str) if t_str else None
-        except Exception:
-            dt = None
-
-        is_today = dt is not None and dt.date() == today
-        is_target_status = status in ("pending", "ignored")
-
-        if is_today and is_target_status:
-            removed += 1
-            continue
-
-        new_db[key] = entry
-
-    save_db(new_db)
+    else:
+        removed = store.delete_day(today)
 
     if removed == 0:
         await update.message.reply_text(
@@ -182,10 +418,17 @@ async def clear_all(update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != BOSS_ID:
         return  # only boss can clear
 
-    db = load_db()
-    count = len(db)
-    db.clear()
-    save_db(db)
+    if sharded:
+        # As in clear_today: each worker clears its part, worker 0 answers
+        total = 0
+        if control:
+            await store.flush()
+            total = await asyncio.to_thread(store.store.count)
+        count = max(store.clear(), total)
+        if not control:
+            return
+    else:
+        count = store.clear()
 
     await update.message.reply_text(f"🧹 Cleared ALL {count} stored alerts.")
 
@@ -194,78 +437,46 @@ async def clear_all(update, context: ContextTypes.DEFAULT_TYPE):
 async def watch_messages(update, context: ContextTypes.DEFAULT_TYPE):
     """
     Detect trigger words or boss mentions in groups.
-    Some triggers route via ROUTES, others use legacy boss/group logic.
+    Each group is checked only against its own rules (see app/routing.py).
+    Only group text gets here (see app/dispatch.py).
     """
-    if not update.message or not update.message.text:
-        return
-    if update.message.chat.type not in ("group", "supergroup"):
+    if not update.message:
         return
 
-    text = update.message.text.lower()
-    print("New message:", text)
-    print("Chat info:", update.message.chat)
-
-    # ---------- 1) ROUTES-BASED TRIGGERS ----------
-    route = None
-    for word, info in ROUTES.items():
-        if word in text:
-            route = info
-            break
-
-    # ---------- 2) LEGACY TRIGGERS (fallback) ----------
-    triggered_to_boss = False
-    triggered_to_group = False
-
-    for word in TRIGGERS_TO_BOSS:
-        if word.lower() in text:
-            triggered_to_boss = True
-            break
-
-    if not triggered_to_boss:
-        for word in TRIGGERS_TO_GROUP:
-            if word.lower() in text:
-                triggered_to_group = True
-                break
-
-    # Direct mention of boss username -> force boss
-    if update.message.entities:
-        for entity in update.message.entities:
-            if (
-                entity.type == "mention"
-                and "@kiengyang" in update.message.text.lower()
-            ):
-                triggered_to_boss = True
-                triggered_to_group = False
-                break
-
-    # Nothing triggered at all -> stop
-    if route is None and not triggered_to_boss and not triggered_to_group:
-        return
+    # One lookup for the chat's rules, one pass over the message for triggers
+    rules = routing.rules_for(update.message.chat.id)
+    hits = rules.matcher.match(update.message.text)
+    for h in hits:
+        TRIGGER_HITS.inc(kind=h.kind, word=h.word)
+    log.debug(
+        "Group message %s in %s, triggers: %s",
+        update.message.message_id,
+        update.message.chat.id,
+        Lazy(lambda: [h.word for h in hits]),
+        extra={"sample": True},
+    )
 
-    # ---------- 3) DECIDE DESTINATION ----------
-    if route is not None:
-        dest_chat_id = route["boss_chat"]
-        thread_id = route.get("thread_id")
-    else:
-        thread_id = None
-        if triggered_to_boss:
-            dest_chat_id = BOSS_ID
-        else:
-            dest_chat_id = ALERT_GROUP_ID
+    # Routes first, then boss mention / boss triggers, then group triggers
+    decision = rules.decide(update.message, hits)
+    if decision is None:
+        return
+    dest_chat_id, thread_id, route, quiet = decision
 
-    # Track trigger user for later voice forwarding
+    # Follow the trigger's sender: their media goes to the same place
     chat_id = update.message.chat.id
-    last_triggered_users[chat_id] = (
-        update.message.from_user.id,
-        datetime.now(),
-        dest_chat_id,
-    )
-    print(f"Tracked trigger: {update.message.from_user.full_name} in {chat_id}")
+    priority = PRIORITY_GROUP if dest_chat_id == rules.group_chat else PRIORITY_BOSS
+    follow.track(chat_id, update.message.from_user.id, dest_chat_id, thread_id, priority)
+    log.debug("Tracked trigger: user %s in %s", update.message.from_user.id, chat_id)
 
     # ---------- 4) SAVE MESSAGE INFO ----------
-    db = load_db()
     key = f"{update.message.chat.id}_{update.message.message_id}"
-    db[key] = {
+    if key in store:
+        # Telegram delivered this update again (e.g. after a restart). An
+        # alert's entry is only stored once its outbox claim succeeded, so
+        # this can't hide an alert that was never recorded
+        log.info("Alert %s already handled, skipping", key)
+        return
+    entry = {
         "group_id": update.message.chat.id,
         "group_title": update.message.chat.title or "group",
         "group_username": update.message.chat.username or "",
@@ -274,23 +485,31 @@ async def watch_messages(update, context: ContextTypes.DEFAULT_TYPE):
         "sender": update.message.from_user.full_name,
         "time": datetime.now().isoformat(),
         "status": "pending",
+        "dest": dest_chat_id,
+        "thread_id": thread_id,
     }
-    save_db(db)
 
-    # ---------- 5) BUILD BUTTONS ----------
-    open_url = None
-    chat_id_str = str(update.message.chat.id)
+    # ---------- 4b) COALESCE INTO AN OPEN BURST ----------
+    line = f"{update.message.from_user.full_name}: {update.message.text}"
+    burst = coalescer.get(chat_id, dest_chat_id, line)
+    if burst is not None:
+        # Each message keeps its own entry, linked to the alert it was
+        # merged into so that alert's buttons act on the whole burst
+        entry["burst"] = burst.lead_key
+        store.put(key, entry)
+        coalescer.add(context.bot, burst, key, line)
+        ALERTS_COALESCED.inc(dest=dest_chat_id)
+        log.info("Coalesced %s into alert %s (%d messages)", key, burst.lead_key, len(burst.keys))
+        return
 
-    if update.message.chat.username:
-        open_url = (
-            f"tg://resolve?domain={update.message.chat.username}"
-            f"&post={update.message.message_id}"
+    # ---------- 5) BUILD BUTTONS ----------
+    open_url = message_link(
+        update.message.chat.id,
+        update.message.chat.username,
+        update.message.message_id,
     )
-    elif chat_id_str.startswith("-100"):
-        chat_id_for_link = chat_id_str[4:]
-        open_url = f"https://t.me/c/{chat_id_for_link}/{update.message.message_id}"
-    else:
-        print("No open_url for this chat (ChatType.GROUP).")
+    if open_url is None:
+        log.debug("No open_url for chat %s (basic group).", update.message.chat.id)
     buttons = []
 
 # Open in group button (keep as is if you like)
@@ -311,49 +530,92 @@ async def watch_messages(update, context: ContextTypes.DEFAULT_TYPE):
 
 
     # ---------- 6) SEND ALERT ----------
-    await context.bot.send_message(
-        chat_id=dest_chat_id,
-        text=(
+    # Recorded in the outbox first, then stored and queued (not awaited): the
+    # send queue handles flood limits and retries
+    payload = alert_payload(
+        dest_chat_id,
+        (
             f"⚠ **Mention Alert**\n"
             f"From: {update.message.from_user.full_name}\n"
             f"Group: {update.message.chat.title}\n\n"
             f"{update.message.text}"
         ),
         reply_markup=kb,
-        # message_thread_id is used only when you want a topic; for now you can
-        # either pass it or leave it out if you prefer main chat
-        message_thread_id=thread_id,
-        # parse_mode="Markdown",
+        # message_thread_id is used only when you want a topic
+        thread_id=thread_id,
+        # Quiet hours: the alert still arrives, just without a notification
+        quiet=quiet,
+    )
+    # The burst is opened before the outbox write yields to the event loop,
+    # so triggers from this chat arriving meanwhile are merged into it
+    future = asyncio.get_running_loop().create_future()
+    coalescer.open(
+        key,
+        f"Group: {update.message.chat.title}",
+        line,
+        chat_id,
+        dest_chat_id,
+        thread_id,
+        priority,
+        kb,
+        coalescer.window_for(chat_id, dest_chat_id, route),
+        future,
     )
 
-    print(f"Forwarded message {key} to {dest_chat_id} with buttons.")
-
-
-# ------------------- VOICE WACHTER -------------------
-
-async def watch_voice(update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message or not update.message.voice:
-        return
-    if update.message.chat.type not in ("group", "supergroup"):
+    outbox_key = f"alert:{key}"
+    try:
+        claimed = await asyncio.to_thread(
+            outbox.claim, outbox_key, "alert", dest_chat_id, payload
+        )
+    except Exception:
+        # Nothing is stored, so a redelivery of the update tries again; the
+        # same goes for triggers merged into the burst meanwhile
+        coalescer.discard(key)
+        future.cancel()
+        store.delete_keys(store.burst_members(key))
+        raise
+    if key not in store:
+        store.put(key, entry)
+    if not claimed:
+        # Sent before a restart, or pending and replayed from the outbox
+        log.info("Alert %s already in the outbox, not sending again", key)
+        coalescer.discard(key)
+        future.cancel()
         return
 
-    chat_id = update.message.chat.id
-    if chat_id not in last_triggered_users:
-        return
+    ALERTS.inc(dest=dest_chat_id)
+    sender.submit(
+        dest_chat_id,
+        lambda: deliver(context.bot, outbox_key, "alert", payload),
+        priority,
+        future=future,
+    )
 
-    trigger_user_id, trigger_time, dest_chat_id = last_triggered_users[chat_id]
+    log.info("Queued alert %s for %s", key, dest_chat_id)
 
-    if update.message.from_user.id != trigger_user_id:
-        return
 
-    time_diff = (datetime.now() - trigger_time).total_seconds()
-    if time_diff > 60:
+# ------------------- MEDIA FOLLOW-UP -------------------
+
+async def watch_media(update, context: ContextTypes.DEFAULT_TYPE):
+    """Forward media from users who recently triggered an alert in this
+    group (see app/follow.py). Queued, not awaited."""
+    if not update.message:
         return
 
-    await update.message.forward(dest_chat_id)
-    print(f"✅ Voice forwarded ({time_diff:.0f}s after trigger)")
+    if follow.handle(context.bot, update.message):
+        log.info(
+            "Following up %s from user %s in %s",
+            update.message.message_id,
+            update.message.from_user.id,
+            update.message.chat.id,
+        )
 
 # ------------------- INLINE BUTTON HANDLER -------------------
+def _alert_keys(key):
+    """The alert's own key plus the keys of triggers coalesced into it."""
+    return [key] + store.burst_members(key)
+
+
 async def button_handler(update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -361,199 +623,440 @@ async def button_handler(update, context: ContextTypes.DEFAULT_TYPE):
     action = data[0]
     key = data[1]
 
-    print("Button clicked:", data)
-    db = load_db()
-
-    if key not in db:
-        await query.edit_message_text("❌ Message expired or not found.")
-        return
+    log.info("Button %s on %s by user %s", action, key, query.from_user.id)
 
-    if action == "ignore":
-        db[key]["status"] = "ignored"
-        save_db(db)
-        await query.edit_message_text("Ignored.")
+    # /search paging: key is the page number, the query is remembered per user
+    if action == "search":
+        search_query = search_queries.get(query.from_user.id)
+        if search_query is None:
+            await query.edit_message_text("🔎 Search expired, run /search again.")
+            return
+        text, kb = await _search_page(search_query, int(key))
+        await query.edit_message_text(text, reply_markup=kb, disable_web_page_preview=True)
         return
 
-    if action == "reply":
-        # Use the user who pressed the button as the reply owner (usually boss)
-        reply_map[query.from_user.id] = key
-        print(f"Reply mode ON for user={query.from_user.id}, key={key}")
+    # /summary paging: key is the page number
+    if action == "summary":
+        text, page, pages = render_page(await _summary_source(), SUMMARY_TITLE, int(key))
         await query.edit_message_text(
-            "✏️ Reply mode activated. Send your reply below in this private chat and it will be forwarded to the group automatically."
+            text,
+            reply_markup=page_keyboard(page, pages),
+            disable_web_page_preview=True,
         )
-
-    if action == "toggle":
-        db[key]["status"] = "replied"
-        save_db(db)
-        await query.edit_message_text("✅ Marked as replied.")
         return
 
+    # Two clicks on the same alert (e.g. Ignore and Mark as replied) must not
+    # interleave when updates are processed concurrently
+    async with alert_locks(key):
+        if key not in store:
+            await query.edit_message_text("❌ Message expired or not found.")
+            return
+
+        # The alert is being answered: stop editing it for new triggers
+        coalescer.discard(key)
+
+        if action == "ignore":
+            for k in _alert_keys(key):
+                store.set_status(k, "ignored")
+            await query.edit_message_text("Ignored.")
+            return
+
+        if action == "reply":
+            # Use the user who pressed the button as the reply owner (usually boss)
+            reply_map[query.from_user.id] = key
+            log.info("Reply mode ON for user=%s, key=%s", query.from_user.id, key)
+            await query.edit_message_text(
+                "✏️ Reply mode activated. Send your reply below in this private chat and it will be forwarded to the group automatically."
+            )
+
+        if action == "toggle":
+            for k in _alert_keys(key):
+                store.set_status(k, "replied")
+            await query.edit_message_text("✅ Marked as replied.")
+            return
+
+
 # ------------------- REPLY HANDLER -------------------
 async def reply_to_group(update, context: ContextTypes.DEFAULT_TYPE):
     """
     Forward reply (from boss or whoever clicked Reply) to the original group
-    as a forwarded message.
+    as a forwarded message. Only private messages from users in reply mode
+    get here (see app/dispatch.py).
     """
     if not update.message:
         return
 
-    user_id = update.effective_user.id
+    user_id = update.message.from_user.id
 
-    # Only handle replies from users who are in reply_map
-    if user_id not in reply_map:
-        print("Message from user without active reply_map -> ignore.")
-        return
+    # One reply per reply-mode activation, even if the user sends two
+    # messages that are processed at the same time
+    async with user_locks(user_id):
+        if user_id not in reply_map:
+            return
+
+        key = reply_map[user_id]
+        entry = store.get(key)
 
-    print("Reply user sent:", update.message)
-    print("Reply user chat info:", update.message.chat)
+        if entry is None:
+            await update.message.reply_text("❌ Original message expired.")
+            del reply_map[user_id]
+            return
 
-    key = reply_map[user_id]
-    db = load_db()
+        log.info(
+            "Forwarding reply from user %s to chat %s (alert %s)",
+            user_id,
+            entry["group_id"],
+            key,
+        )
 
-    if key not in db:
-        await update.message.reply_text("❌ Original message expired.")
+        # Forward the user's message (text, voice, photo, etc.) to the original
+        # group, through the outbox so a crash mid-forward is retried on startup
+        outbox_key = f"forward:{user_id}:{update.message.message_id}"
+        payload = forward_payload(
+            entry["group_id"], update.message.chat_id, update.message.message_id, key
+        )
+        queued = error = None
+        async with alert_locks(key):
+            if await asyncio.to_thread(outbox.claim, outbox_key, "forward", entry["group_id"], payload):
+                try:
+                    await deliver(context.bot, outbox_key, "forward", payload)
+                except BadRequest as e:
+                    error = e
+                except (RetryAfter, TimedOut, NetworkError):
+                    # Still pending in the outbox; the send queue keeps trying,
+                    # and marks the alert replied once it goes through
+                    sender.submit(
+                        entry["group_id"],
+                        lambda: deliver(context.bot, outbox_key, "forward", payload),
+                        PRIORITY_BOSS,
+                    )
+                    queued = True
+                except Exception as e:
+                    log.exception("Forward %s failed", outbox_key)
+                    error = e
+            if not (queued or error):
+                for k in _alert_keys(key):
+                    store.set_status(k, "replied")
+
+        # Reply mode ends either way, so a second message isn't forwarded too
+        if error is not None:
+            await update.message.reply_text(f"❌ Couldn't forward your reply: {error}")
+        elif queued:
+            await update.message.reply_text(
+                "⏳ Telegram is busy; your reply will be forwarded shortly, no need to send it again."
+            )
+        else:
+            await update.message.reply_text("✅ Your reply has been forwarded to the group.")
         del reply_map[user_id]
-        return
+        log.info("Reply mode OFF for user=%s", user_id)
+
+
+# ------------------- OUTBOX DELIVERY -------------------
+async def deliver(bot, outbox_key, kind, payload):
+    """Do one outbox action and record the outcome. Transient errors are
+    re-raised for the send queue to retry; the row stays pending meanwhile,
+    so it is replayed if the bot dies before it goes through."""
+    try:
+        result = await perform(bot, kind, payload)
+    except BadRequest as e:
+        await asyncio.to_thread(outbox.failed, outbox_key, repr(e))
+        raise
+    except (RetryAfter, TimedOut, NetworkError):
+        raise
+    except Exception as e:
+        await asyncio.to_thread(outbox.failed, outbox_key, repr(e))
+        raise
+    await asyncio.to_thread(outbox.done, outbox_key, getattr(result, "message_id", None))
+    if kind == "forward":
+        for k in _alert_keys(payload["alert_key"]):
+            store.set_status(k, "replied")
+    return result
+
+
+async def replay_outbox(bot):
+    """Send whatever was recorded but not confirmed before the last exit."""
+    items = await asyncio.to_thread(outbox.pending)
+    for outbox_key, kind, chat_id, payload in items:
+        sender.submit(
+            chat_id,
+            lambda k=outbox_key, kind=kind, p=payload: deliver(bot, k, kind, p),
+            PRIORITY_BOSS,
+        )
+    if items:
+        log.warning("Replaying %d undelivered outbox item(s)", len(items))
+
 
-    entry = db[key]
-    print("reply_to_group triggered")
-    print("Forwarding reply message")
-    print("Target chat_id:", entry["group_id"], "message_id:", entry["message_id"])
+async def outbox_job(context: ContextTypes.DEFAULT_TYPE):
+    """Forget delivered outbox entries once redelivery can't happen."""
+    await asyncio.to_thread(outbox.prune, OUTBOX_KEEP_HOURS * 3600)
 
-    # Forward the user's message (text, voice, photo, etc.) to the original group
-    await update.message.forward(chat_id=entry["group_id"])
 
-    db[key]["status"] = "replied"
-    save_db(db)
+# ------------------- DAILY SUMMARY -------------------
+async def _summary_source():
+    """What /summary reads: the cache, or in sharded mode the shared DB
+    (which is at most DB_FLUSH_INTERVAL behind the other workers)."""
+    if not sharded:
+        return store
+    await store.flush()
+    return SummaryView(await asyncio.to_thread(
+        lambda: {status: store.store.by_status(status) for status, _ in SECTIONS}
+    ))
+
+
+async def _send_digest(bot, dest, thread_id, view, limit):
+    """All pages of one destination's digest, in order."""
+    async with limit:
+        pages = page_count(view)
+        try:
+            for page in range(pages):
+                text, _, _ = render_page(view, DAILY_SUMMARY_TITLE, page)
+                # The send queue applies flood limits and retries
+                await sender.send_message(
+                    bot,
+                    dest,
+                    text,
+                    priority=PRIORITY_DIGEST,
+                    message_thread_id=thread_id,
+                 #   parse_mode="Markdown",
+                    disable_web_page_preview=True,
+                )
+        except Exception as e:
+            log.error("Daily summary to %s failed: %r", dest, e)
+
+
+async def daily_summary(context: ContextTypes.DEFAULT_TYPE):
+    """Send each destination the pending and ignored alerts that were sent to
+    it, with timestamps. Split into several messages when it doesn't fit in
+    one. The job's data is the set of (chat_id, thread_id) it covers; None
+    means every destination without its own schedule."""
+    only = context.job.data if context.job is not None else None
+
+    def covered(dest):
+        return dest in only if only is not None else dest not in SUMMARY_SCHEDULES
+
+    if sharded:
+        # Other workers' alerts are only in the shared DB
+        await store.flush()
+        split = await asyncio.to_thread(split_by_destination, store.store, BOSS_ID)
+    else:
+        split = split_by_destination(store, BOSS_ID)
+    views = {dest: view for dest, view in split.items() if covered(dest)}
+
+    # The boss hears about an empty day, as before
+    if covered((BOSS_ID, None)) and (BOSS_ID, None) not in views:
+        sender.send_message(
+            context.bot, BOSS_ID, "📊 No pending or ignored messages today.",
+            priority=PRIORITY_DIGEST,
+        )
 
-    await update.message.reply_text("✅ Your reply has been forwarded to the group.")
-    del reply_map[user_id]
-    print(f"Reply mode OFF for user={user_id}")
+    # Destinations in parallel (bounded), each one's pages in order
+    limit = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    await asyncio.gather(*(
+        _send_digest(context.bot, dest, thread_id, view, limit)
+        for (dest, thread_id), view in views.items()
+    ))
+    log.info("Daily summary sent to %d destination(s)", len(views))
 
 
-# ------------------- DAILY SUMMARY -------------------
-async def daily_summary(job):
-    """Send daily summary of pending and ignored messages, with timestamps."""
-    db = load_db()
-
-    pending = []
-    ignored = []
-
-    for entry in db.values():
-        status = entry.get("status")
-        if status == "pending":
-            pending.append(entry)
-        elif status == "ignored":
-            ignored.append(entry)
-
-    if not pending and not ignored:
-        await job.bot.send_message(BOSS_ID, "📊 No pending or ignored messages today.")
+def _daily_time(spec, tz):
+    hour, minute = (int(x) for x in spec.split(":"))
+    return time(hour=hour, minute=minute, tzinfo=ZoneInfo(tz))
+
+# ------------------- ROUTING FILE WATCH -------------------
+async def routing_watch_job(context: ContextTypes.DEFAULT_TYPE):
+    """Reload the routing file when it changes on disk."""
+    if file_mtime(ROUTING_FILE) == routing_mtime:
         return
+    try:
+        await reload_routing()
+    except (OSError, ValueError) as e:
+        log.error("Routing file %s not reloaded: %s", ROUTING_FILE, e)
 
-    def build_section(title, items):
-        if not items:
-            return f"*{title}*\n_No messages._\n\n"
 
-        try:
-            items.sort(key=lambda e: datetime.fromisoformat(e["time"]))
-        except Exception:
-            pass
-
-        text = f"*{title}*\n"
-        for e in items:
-            try:
-                dt = datetime.fromisoformat(e["time"])
-                time_str = dt.strftime("%Y-%m-%d %H:%M")
-            except Exception:
-                time_str = e.get("time", "Unknown time")
-
-            group_title = e.get("group_title", "group")
-            sender = e.get("sender", "Unknown")
-            preview = (e.get("text") or "").replace("\n", " ")[:80]
-
-            group_username = e.get("group_username")
-            group_id = e.get("group_id")
-            message_id = e.get("message_id")
-
-            if group_username:
-                open_link = f"tg://resolve?domain={group_username}&post={message_id}"
-            elif str(group_id).startswith("-100"):
-                chat_id_for_link = str(group_id)[4:]
-                open_link = f"https://t.me/c/{chat_id_for_link}/{message_id}"
-            else:
-                open_link = f"Message ID: `{message_id}`"
+async def _index_archive():
+    count = await asyncio.to_thread(index_archive, store.store, ARCHIVE_DIR)
+    if count:
+        log.info("Indexed %d archived alerts for search", count)
 
-            text += (
-                f"- `[{time_str}]` *{group_title}* — *{sender}*\n"
-                f"  {preview}...\n"
-            )
 
-            if open_link.startswith("http") or open_link.startswith("tg://"):
-                text += f"  [Open message]({open_link})\n\n"
-            else:
-                text += f"  {open_link}\n\n"
+# ------------------- RETENTION -------------------
+async def retention_job(context: ContextTypes.DEFAULT_TYPE):
+    """Move old replied alerts to the archive and compact the DB."""
+    moved = await archive_old_alerts(store, ARCHIVE_DIR, RETENTION_DAYS)
+    if moved:
+        log.info("Archived %d replied alerts older than %d days.", moved, RETENTION_DAYS)
 
-        return text
 
-    msg = "📊 *Daily Summary — Pending & Ignored Messages*\n\n"
-    msg += build_section("⏳ Pending", pending)
-    msg += build_section("🚫 Ignored", ignored)
+# ------------------- REPLY / FOLLOW-UP STATE -------------------
+def _state_maps():
+    return {"reply_map": reply_map, "media_follow": follow.entries}
 
-    await job.bot.send_message(
-        BOSS_ID,
-        msg,
-     #   parse_mode="Markdown",
-        disable_web_page_preview=True,
-    )
 
-# ------------------- MAIN -------------------
-def main():
-    request = HTTPXRequest(
-        connect_timeout=20.0,
-        read_timeout=20.0,
-        write_timeout=20.0,
-        pool_timeout=5.0,
-    )
+async def save_state(force=False):
+    maps = _state_maps()
+    if not force and not any(m.dirty for m in maps.values()):
+        return
+    data = snapshot_maps(maps)
+    await asyncio.to_thread(write_snapshot, STATE_FILE, data)
+
+
+async def state_job(context: ContextTypes.DEFAULT_TYPE):
+    """Evict expired reply/follow-up entries and snapshot what's left."""
+    reply_map.expire()
+    follow.expire()
+    coalescer.expire()
+    await save_state()
 
-    app = (
+
+# ------------------- MAIN -------------------
+async def post_init(application):
+    global metrics_server, index_task
+
+    load_snapshot(STATE_FILE, _state_maps())
+    store.start()
+    sender.start()
+    await replay_outbox(application.bot)
+    if store.store.search_path and control:
+        # Alerts archived before search existed; runs once, in the background
+        index_task = asyncio.create_task(_index_archive())
+    if METRICS_PORT:
+        metrics_server = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+
+
+async def post_shutdown(application):
+    # Let pending burst edits and queued alerts go out, then do a final DB
+    # flush so nothing written in the last interval is lost
+    await coalescer.close()
+    await follow.close()
+    await sender.close()
+    outbox.close()
+    if index_task is not None:
+        # Can't interrupt the backfill thread; let it finish before the DB closes
+        await index_task
+    await store.close()
+    await save_state(force=True)
+    if metrics_server is not None:
+        metrics_server.close()
+
+
+def build_app(request=None, get_updates_request=None, job_queue=None):
+    """Application with all handlers and jobs registered. The requests
+    default to the instrumented connection pools from app/http.py; the
+    benchmark passes a stub, app/tenants.py shared pools and job queue."""
+    if request is None:
+        request, get_updates_request = build_requests_from_config()
+
+    builder = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
         .request(request)
-        .build()
+        # A shard worker keeps the per-chat order the ingress delivers in
+        .concurrent_updates(
+            ChatOrderedProcessor(CONCURRENT_UPDATES) if sharded else CONCURRENT_UPDATES
+        )
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
     )
+    if get_updates_request is not None:
+        # getUpdates has its own pool, so sends never hold up polling
+        builder = builder.get_updates_request(get_updates_request)
+    if job_queue is not None:
+        builder = builder.job_queue(job_queue)
+    if TELEGRAM_BASE_URL:
+        # e.g. a local Bot API server or a fake endpoint for testing
+        builder = builder.base_url(f"{TELEGRAM_BASE_URL}/bot").base_file_url(
+            f"{TELEGRAM_BASE_URL}/file/bot"
+        )
+    app = builder.build()
+
+    # Update lag (message date -> now), recorded once per update
+    app.add_handler(TypeHandler(Update, record_update_lag), group=-1)
 
     # Commands
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("summary", manual_summary))
-    app.add_handler(CommandHandler("clear_today", clear_today))
-    app.add_handler(MessageHandler(filters.VOICE, watch_voice), group=2)
-    app.add_handler(CommandHandler("clear_all", clear_all))
-    # Replies from boss / whoever clicked Reply button
+    app.add_handler(CommandHandler("start", timed(start)))
+    app.add_handler(CommandHandler("summary", timed(manual_summary)))
+    app.add_handler(CommandHandler("clear_today", timed(clear_today)))
+    if follow.types:
+        app.add_handler(
+            MessageHandler(group_media(media_filter(follow.types)), timed(watch_media)),
+            group=2,
+        )
+    app.add_handler(CommandHandler("clear_all", timed(clear_all)))
+    app.add_handler(CommandHandler("queue", timed(queue_status)))
+    app.add_handler(CommandHandler("reload", timed(reload_config)))
+    app.add_handler(CommandHandler("search", timed(search)))
+    app.add_handler(CommandHandler("export", timed(export)))
+    # Replies from boss / whoever clicked Reply button, in private chat.
+    # Filtered on chat type and reply mode before the handler runs, so
+    # group traffic skips it entirely
     app.add_handler(
-        MessageHandler(
-            filters.ALL & ~filters.COMMAND,
-            reply_to_group,
-        ),
+        MessageHandler(reply_filter(reply_map), timed(reply_to_group)),
         group=0,
     )
 
     # Group watcher (must come after reply handler)
     app.add_handler(
-        MessageHandler(
-            filters.TEXT & ~filters.COMMAND,
-            watch_messages,
-        ),
+        MessageHandler(GROUP_TEXT, timed(watch_messages)),
         group=1,
     )
 
     # Button clicks
-    app.add_handler(CallbackQueryHandler(button_handler))
+    app.add_handler(CallbackQueryHandler(timed(button_handler)))
+
+    # Daily summaries: one job for the default schedule, one per destination
+    # with its own time/timezone
+    if control:
+        app.job_queue.run_daily(
+            timed(daily_summary), time=_daily_time(DAILY_SUMMARY_TIME, DAILY_SUMMARY_TZ)
+        )
+    for dest, schedule in (SUMMARY_SCHEDULES if control else {}).items():
+        app.job_queue.run_daily(
+            timed(daily_summary),
+            time=_daily_time(
+                schedule.get("time", DAILY_SUMMARY_TIME),
+                schedule.get("tz", DAILY_SUMMARY_TZ),
+            ),
+            data={dest},
+            name=f"daily_summary {dest}",
+        )
+
+    # Expire and snapshot reply mode / media follow-up state
+    app.job_queue.run_repeating(timed(state_job), interval=STATE_SAVE_INTERVAL, first=STATE_SAVE_INTERVAL)
 
-    # Daily summary
-    app.job_queue.run_daily(daily_summary, time=time(hour=21, minute=0))
+    # Drop outbox entries that are past Telegram's redelivery window
+    app.job_queue.run_repeating(timed(outbox_job), interval=3600, first=3600)
 
-    print("✅ Bot running...")
-    app.run_polling()
+    # Pick up edits to the routing file
+    if ROUTING_FILE and ROUTING_WATCH_INTERVAL > 0:
+        app.job_queue.run_repeating(
+            timed(routing_watch_job), interval=ROUTING_WATCH_INTERVAL, first=ROUTING_WATCH_INTERVAL
+        )
+
+    # Archive old replied alerts so the live DB stays small
+    if RETENTION_DAYS > 0:
+        app.job_queue.run_repeating(timed(retention_job), interval=RETENTION_INTERVAL, first=60)
+
+    return app
+
+
+def main():
+    if SHARDS > 1:
+        log.error("SHARDS=%d: start the bot with python -m app.shard", SHARDS)
+        return
+    app = build_app()
+
+    if BOT_MODE == "webhook":
+        log.info("✅ Bot running (webhook on %s:%s/%s)...", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        log.info("✅ Bot running...")
+        app.run_polling()
 
 
 if __name__ == "__main__":
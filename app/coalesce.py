@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest
+
+log = logging.getLogger(__name__)
+
+# ------------------- BURST COALESCING -------------------
+# When a group keeps hitting triggers (a thread about "production"...), only
+# the first trigger sends an alert. Later triggers from the same source chat
+# to the same destination, within the coalescing window, are appended to that
+# alert, which is edited in place with a counter. Edits are debounced, so a
+# burst of N triggers costs one send plus a few edits instead of N sends.
+
+# Telegram rejects messages over 4096 characters; leave room for the header
+MAX_TEXT = 3800
+
+
+class Burst:
+    __slots__ = (
+        "lead_key", "keys", "header", "lines", "chat_id", "dest", "thread_id",
+        "priority", "reply_markup", "deadline", "future", "edit_task", "bot",
+    )
+
+    def __init__(self, lead_key, header, line, chat_id, dest, thread_id,
+                 priority, reply_markup, deadline, future):
+        self.lead_key = lead_key
+        self.keys = [lead_key]
+        self.header = header
+        self.lines = [line]
+        self.chat_id = chat_id
+        self.dest = dest
+        self.thread_id = thread_id
+        self.priority = priority
+        self.reply_markup = reply_markup
+        self.deadline = deadline
+        self.future = future  # resolves to the sent alert Message
+        self.edit_task = None
+        self.bot = None
+
+    def has_room(self, line):
+        return sum(len(s) + 1 for s in self.lines) + len(line) < MAX_TEXT
+
+    def render(self):
+        return (
+            f"⚠ **Mention Alert** (×{len(self.lines)})\n"
+            f"{self.header}\n\n" + "\n".join(self.lines)
+        )
+
+
+class Coalescer:
+    def __init__(self, sender, window=60, windows=None, edit_delay=3.0):
+        self.sender = sender
+        self.window = window
+        self.windows = windows or {}  # (source chat, dest) -> seconds
+        self.edit_delay = edit_delay
+        self._bursts = {}  # (source chat, dest) -> Burst
+
+    def window_for(self, chat_id, dest, route=None):
+        if route is not None and route.get("coalesce_window") is not None:
+            return route["coalesce_window"]
+        return self.windows.get((chat_id, dest), self.window)
+
+    def get(self, chat_id, dest, line):
+        """The open burst `line` can be added to, or None."""
+        burst = self._bursts.get((chat_id, dest))
+        if burst is None:
+            return None
+        if burst.deadline <= time.monotonic() or not burst.has_room(line):
+            del self._bursts[(chat_id, dest)]
+            return None
+        if burst.future.done() and burst.future.exception() is not None:
+            # The first alert never went out; there's nothing to edit
+            del self._bursts[(chat_id, dest)]
+            return None
+        return burst
+
+    def open(self, key, header, line, chat_id, dest, thread_id, priority,
+             reply_markup, window, future):
+        if window <= 0:
+            return
+        self._bursts[(chat_id, dest)] = Burst(
+            key, header, line, chat_id, dest, thread_id, priority,
+            reply_markup, time.monotonic() + window, future,
+        )
+
+    def add(self, bot, burst, key, line):
+        """Append a trigger to `burst`; the alert is edited a moment later."""
+        burst.keys.append(key)
+        burst.lines.append(line)
+        burst.bot = bot
+        if burst.edit_task is None:
+            burst.edit_task = asyncio.create_task(self._edit_later(burst))
+
+    def discard(self, lead_key):
+        """Close the burst led by `lead_key` (its alert was answered), so the
+        next trigger sends a fresh alert instead of editing the old one."""
+        for k, burst in list(self._bursts.items()):
+            if burst.lead_key == lead_key:
+                if burst.edit_task is not None:
+                    burst.edit_task.cancel()
+                del self._bursts[k]
+
+    def expire(self):
+        now = time.monotonic()
+        for k in [k for k, b in self._bursts.items() if b.deadline <= now and b.edit_task is None]:
+            del self._bursts[k]
+
+    async def close(self):
+        """Send pending edits right away (used on shutdown)."""
+        pending = [b for b in self._bursts.values() if b.edit_task is not None]
+        for burst in pending:
+            burst.edit_task.cancel()
+        await asyncio.gather(*(b.edit_task for b in pending), return_exceptions=True)
+        for burst in pending:
+            await self._submit_edit(burst)
+        self._bursts.clear()
+
+    # ---------- internals ----------
+    async def _edit_later(self, burst):
+        await asyncio.sleep(self.edit_delay)
+        await self._submit_edit(burst)
+
+    async def _submit_edit(self, burst):
+        try:
+            message = await burst.future
+        except Exception:
+            burst.edit_task = None
+            return
+        # Lines added from here on schedule a new edit
+        burst.edit_task = None
+        bot, text = burst.bot, burst.render()
+        self.sender.submit(
+            burst.dest,
+            lambda: _edit(bot, message, text, burst.reply_markup),
+            burst.priority,
+        )
+
+
+async def _edit(bot, message, text, reply_markup):
+    try:
+        return await bot.edit_message_text(
+            text,
+            chat_id=message.chat_id,
+            message_id=message.message_id,
+            reply_markup=reply_markup,
+        )
+    except BadRequest as e:
+        # Two edits racing with the same text
+        if "not modified" not in str(e).lower():
+            raise
+        log.debug("Alert %s already up to date", message.message_id)
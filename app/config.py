@@ -3,6 +3,24 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 BOSS_ID = int(os.getenv("BOSS_ID")) if os.getenv("BOSS_ID") else None
 ALERT_GROUP_ID = int(os.getenv("GROUP_ID")) if os.getenv("GROUP_ID") else None
@@ -11,6 +29,166 @@ THREAD_TEST = int(os.getenv("THREAD_TEST")) if os.getenv("THREAD_TEST") else Non
 TRIGGERS_TO_BOSS = ["@longdy_seng", "plan", "operation", "production","apple","kiss","you","longdy_seng","longdy"]
 TRIGGERS_TO_GROUP = ["yang",]
 
+# @usernames that count as mentioning the boss (a text mention of BOSS_ID,
+# for users without a username, always counts)
+BOSS_USERNAMES = ["kiengyang"]
+
+# Optional JSON file that replaces the trigger settings in this file
+# (to_boss, to_group, boss_usernames, routes, chats; see app/routing.py).
+# It is checked for changes every ROUTING_WATCH_INTERVAL seconds (0 = only
+# on /reload) and can be reloaded by the boss with /reload.
+ROUTING_FILE = os.getenv("ROUTING_FILE", "app/routing.json")
+ROUTING_WATCH_INTERVAL = _env_int("ROUTING_WATCH_INTERVAL", 5)
+
+# Trigger matching options
+# TRIGGER_WORD_BOUNDARY: only match whole words, so "you" no longer matches "your"
+# TRIGGER_CASEFOLD: full Unicode case folding instead of plain lower()
+TRIGGER_WORD_BOUNDARY = _env_bool("TRIGGER_WORD_BOUNDARY")
+TRIGGER_CASEFOLD = _env_bool("TRIGGER_CASEFOLD")
+
+# Alert database (SQLite). An old JSON db at LEGACY_DB_FILE is imported once.
+DB_FILE = os.getenv("DB_FILE", "app/alerts.db")
+LEGACY_DB_FILE = os.getenv("LEGACY_DB_FILE", "app/db.json")
+
+# Outbox: alert sends and reply forwards are recorded here before they are
+# attempted and replayed on startup if the bot died first. Finished entries
+# are kept OUTBOX_KEEP_HOURS to catch updates Telegram delivers twice.
+OUTBOX_FILE = os.getenv("OUTBOX_FILE", "app/outbox.db")
+OUTBOX_KEEP_HOURS = _env_int("OUTBOX_KEEP_HOURS", 48)
+
+# Full-text search index for /search (a separate SQLite file; empty = off).
+# It covers archived alerts too, so it grows with the whole history.
+SEARCH_DB_FILE = os.getenv("SEARCH_DB_FILE", "app/search.db")
+
+# Alert DB write-behind: changes are flushed every DB_FLUSH_INTERVAL seconds,
+# or as soon as DB_FLUSH_MAX_DIRTY changes are waiting
+DB_FLUSH_INTERVAL = _env_float("DB_FLUSH_INTERVAL", 2.0)
+DB_FLUSH_MAX_DIRTY = _env_int("DB_FLUSH_MAX_DIRTY", 100)
+
+# Retention: replied alerts older than RETENTION_DAYS are moved to gzipped
+# daily JSONL files in ARCHIVE_DIR (checked every RETENTION_INTERVAL seconds).
+# RETENTION_DAYS=0 keeps everything in the live DB.
+RETENTION_DAYS = _env_int("RETENTION_DAYS", 30)
+RETENTION_INTERVAL = _env_int("RETENTION_INTERVAL", 3600)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "app/archive")
+
+# /export files larger than this (compressed, in MB) aren't sent: the upload
+# reads the whole file into memory, and Telegram takes at most 50 MB from bots
+EXPORT_MAX_MB = _env_int("EXPORT_MAX_MB", 50)
+
+# In-memory reply/follow-up state, snapshotted to STATE_FILE so it survives restarts
+# REPLY_MODE_TTL: how long reply mode stays on after pressing Reply (seconds)
+# VOICE_FOLLOW_WINDOW: media from a trigger's sender is forwarded this long
+STATE_FILE = os.getenv("STATE_FILE", "app/state.json")
+STATE_MAX_ENTRIES = _env_int("STATE_MAX_ENTRIES", 10000)
+REPLY_MODE_TTL = _env_int("REPLY_MODE_TTL", 3600)
+VOICE_FOLLOW_WINDOW = _env_int("VOICE_FOLLOW_WINDOW", 60)
+STATE_SAVE_INTERVAL = _env_int("STATE_SAVE_INTERVAL", 10)
+
+# Media follow-up: after a trigger, media of these types from the same sender
+# in that group is forwarded to the alert's destination for
+# VOICE_FOLLOW_WINDOW seconds (FOLLOW_WINDOWS overrides it per type, 0 = off).
+# Types: the MEDIA_TYPES below (MEDIA_FILTERS in app/follow.py).
+# Album items arriving within ALBUM_DELAY seconds are forwarded together.
+MEDIA_TYPES = ("voice", "video_note", "audio", "photo", "video", "animation", "document")
+FOLLOW_MEDIA = [
+    t.strip()
+    for t in os.getenv("FOLLOW_MEDIA", "voice,video_note,audio,photo,video,document").split(",")
+    if t.strip()
+]
+_unknown_media = [t for t in FOLLOW_MEDIA if t not in MEDIA_TYPES]
+if _unknown_media:
+    raise ValueError(
+        f"FOLLOW_MEDIA: unknown media type(s) {', '.join(_unknown_media)}; "
+        f"use any of {', '.join(MEDIA_TYPES)}"
+    )
+FOLLOW_WINDOWS = {
+    # "document": 300,
+}
+ALBUM_DELAY = _env_float("ALBUM_DELAY", 1.0)
+
+# Logging: LOG_LEVEL (DEBUG/INFO/WARNING...), LOG_FORMAT "text" or "json".
+# Per-message debug events are sampled: only 1 in LOG_DEBUG_SAMPLE is logged.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_DEBUG_SAMPLE = _env_int("LOG_DEBUG_SAMPLE", 100)
+
+# Burst coalescing: triggers from the same group to the same destination
+# within COALESCE_WINDOW seconds of an alert are added to that alert (edited
+# at most every COALESCE_EDIT_DELAY seconds) instead of sending a new one.
+# 0 = one alert per message. Per pair overrides go in COALESCE_WINDOWS, and a
+# route can set "coalesce_window".
+COALESCE_WINDOW = _env_int("COALESCE_WINDOW", 60)
+COALESCE_EDIT_DELAY = _env_float("COALESCE_EDIT_DELAY", 3.0)
+COALESCE_WINDOWS = {
+    # (source_group_chat_id, dest_chat_id): seconds,
+}
+
+# Daily summary: every destination that has pending/ignored alerts gets its
+# own digest at DAILY_SUMMARY_TIME (HH:MM) in DAILY_SUMMARY_TZ. Digests go
+# out SUMMARY_CONCURRENCY destinations at a time through the send queue.
+DAILY_SUMMARY_TIME = os.getenv("DAILY_SUMMARY_TIME", "21:00")
+DAILY_SUMMARY_TZ = os.getenv("DAILY_SUMMARY_TZ", "UTC")
+SUMMARY_CONCURRENCY = _env_int("SUMMARY_CONCURRENCY", 8)
+# Destinations with their own schedule, keyed by (chat_id, thread_id):
+SUMMARY_SCHEDULES = {
+    # (-1001234567890, None): {"time": "08:30", "tz": "Asia/Phnom_Penh"},
+}
+
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics (0 = off)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _env_int("METRICS_PORT", 9108)
+
+# Outbound alert queue (Telegram allows ~30 msg/s overall, ~1 msg/s per chat)
+SEND_GLOBAL_RATE = _env_float("SEND_GLOBAL_RATE", 25.0)
+SEND_CHAT_RATE = _env_float("SEND_CHAT_RATE", 1.0)
+SEND_CHAT_BURST = _env_int("SEND_CHAT_BURST", 3)
+SEND_WORKERS = _env_int("SEND_WORKERS", 4)
+
+# Bot API connection pools (see app/http.py), timeouts in seconds.
+# HTTP_POOL_SIZE: alerts, edits, answers; HTTP_MEDIA_POOL_SIZE: forwards
+# and copies of user media (HTTP_MEDIA_TIMEOUT for their reads/writes).
+# HTTP_POLL_READ_TIMEOUT is added to the getUpdates long-poll timeout.
+# HTTP2 needs the h2 package (pip install "httpx[http2]").
+HTTP_POOL_SIZE = _env_int("HTTP_POOL_SIZE", 16)
+HTTP_MEDIA_POOL_SIZE = _env_int("HTTP_MEDIA_POOL_SIZE", 8)
+HTTP_CONNECT_TIMEOUT = _env_float("HTTP_CONNECT_TIMEOUT", 10.0)
+HTTP_READ_TIMEOUT = _env_float("HTTP_READ_TIMEOUT", 20.0)
+HTTP_WRITE_TIMEOUT = _env_float("HTTP_WRITE_TIMEOUT", 20.0)
+HTTP_MEDIA_TIMEOUT = _env_float("HTTP_MEDIA_TIMEOUT", 60.0)
+HTTP_POLL_READ_TIMEOUT = _env_float("HTTP_POLL_READ_TIMEOUT", 10.0)
+HTTP_POOL_TIMEOUT = _env_float("HTTP_POOL_TIMEOUT", 10.0)
+HTTP_KEEPALIVE = _env_float("HTTP_KEEPALIVE", 30.0)
+HTTP2 = _env_bool("HTTP2")
+
+# How updates are received: "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+# Number of updates handled at the same time (1 = one by one)
+CONCURRENT_UPDATES = _env_int("CONCURRENT_UPDATES", 32)
+
+# Sharded mode (python -m app.shard): one ingress process receives updates
+# and hands them to SHARDS worker processes. Each worker owns the source
+# chats with chat_id % SHARDS == its index (see app/shard.py). SHARD_INDEX
+# is set by the ingress for each worker; don't set it yourself.
+SHARDS = _env_int("SHARDS", 1)
+SHARD_INDEX = int(os.getenv("SHARD_INDEX")) if os.getenv("SHARD_INDEX") else None
+# Multi-tenant mode (python -m app.tenants): one process runs a bot for
+# every tenant in TENANTS_FILE, each with its own token, boss and data files
+# under TENANT_DIR/<name>/ (see app/tenants.py)
+TENANTS_FILE = os.getenv("TENANTS_FILE", "app/tenants.json")
+TENANT_DIR = os.getenv("TENANT_DIR", "app/tenants")
+# Alternative Bot API endpoint, e.g. http://127.0.0.1:8081 (local Bot API
+# server or a fake Telegram server for testing). Empty = api.telegram.org
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "").rstrip("/")
+
+# Webhook mode: local HTTP server on WEBHOOK_LISTEN:WEBHOOK_PORT, and the
+# public HTTPS URL Telegram should post updates to
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = _env_int("WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or None
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
 
 # Map trigger words to boss groups (and optional topic/thread id)
 ROUTES = {
@@ -21,6 +199,23 @@ ROUTES = {
     # "option": {
     #     "boss_chat": ALERT_GROUP_ID, # another boss group
     #     "thread_id": THREAD_TEST,
+    #     "coalesce_window": 0,        # optional: always one alert per message
     # },
     # # add more triggers as needed
 }
+
+
+# Per-group routing, keyed by the source group's chat_id. Groups not listed
+# use the global triggers and destinations above. Every key is optional:
+CHAT_ROUTES = {
+    # -1001234567890: {
+    #     "to_boss": ["plan", "production"],   # replaces TRIGGERS_TO_BOSS here
+    #     "to_group": [],                      # replaces TRIGGERS_TO_GROUP here
+    #     "routes": {},                        # replaces ROUTES here
+    #     "boss_chat": BOSS_ID,                # where boss alerts go
+    #     "group_chat": ALERT_GROUP_ID,        # where group alerts go
+    #     "thread_id": None,                   # topic in the destination
+    #     "quiet_hours": (22, 7),              # local hours; alerts arrive silently
+    #     "mentions": ["kiengyang"],           # replaces BOSS_USERNAMES here
+    # },
+}
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+
+from telegram.ext import BaseUpdateProcessor, filters
+
+from app.locks import KeyedLocks
+
+# ------------------- DISPATCH FILTERS -------------------
+# Handlers only see the updates they can act on. PTB checks every handler's
+# filter for every update, so the cheap tests go first (chat type is a field
+# comparison, reply mode one dict lookup) and `&` short-circuits the rest.
+# Group traffic never reaches the reply handler, and private chats never
+# reach the trigger matcher.
+
+
+class InReplyMode(filters.MessageFilter):
+    """Messages from a user with an active reply mode (a key of `reply_map`)."""
+
+    __slots__ = ("reply_map",)
+
+    def __init__(self, reply_map):
+        super().__init__(name="InReplyMode")
+        self.reply_map = reply_map
+
+    def filter(self, message):
+        user = message.from_user
+        return user is not None and user.id in self.reply_map
+
+
+def reply_filter(reply_map):
+    """Private, non-command messages from users in reply mode."""
+    return filters.ChatType.PRIVATE & InReplyMode(reply_map) & ~filters.COMMAND
+
+
+# Group text that may contain triggers
+GROUP_TEXT = filters.ChatType.GROUPS & filters.TEXT & ~filters.COMMAND
+
+
+def group_media(media):
+    """Group messages matching the `media` filter (see app/follow.py)."""
+    return filters.ChatType.GROUPS & media
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """Handles up to `max_concurrent_updates` updates at once, but the updates
+    of one chat one at a time, in the order they arrived. Used by the shard
+    workers (app/shard.py), which get each chat's updates in order from the
+    ingress and must keep it that way."""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # process_update() takes PTB's semaphore before do_process_update(),
+        # so a busy chat's queued updates would hold every slot while they
+        # wait for the chat lock. Let that one through and take a slot of
+        # our own once the chat lock is ours.
+        self._slots = self._semaphore
+        self._semaphore = asyncio.BoundedSemaphore(sys.maxsize)
+        self._chats = KeyedLocks()
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+        # asyncio.Lock wakes waiters first come, first served
+        async with self._chats(chat.id):
+            async with self._slots:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
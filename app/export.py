@@ -0,0 +1,112 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import date
+
+from app.archive import iter_archive
+from app.storage import COLUMNS
+
+# ------------------- EXPORT -------------------
+# Alert history as gzipped JSONL or CSV: archived segments first (oldest),
+# then the live DB. Records are pulled one at a time through generators and
+# written through a fixed-size buffer, so memory use doesn't depend on how
+# many alerts there are.
+#
+# python -m app.export --since 2024-05-01 --status replied --format csv -o out.csv.gz
+
+FIELDS = ("key",) + COLUMNS + ("archived",)
+FORMATS = ("jsonl", "csv")
+BUFFER_SIZE = 64 * 1024
+
+
+def iter_alerts(store, archive_dir, since=None, status=None):
+    """Yield matching alerts (dicts with FIELDS), archive first. `store` is
+    an AlertStore; `since` an ISO date string."""
+    if archive_dir:
+        since_day = date.fromisoformat(since) if since else None
+        for record in iter_archive(archive_dir, since_day):
+            if since and (record.get("time") or "") < since:
+                continue
+            if status and record.get("status") != status:
+                continue
+            record["archived"] = True
+            yield record
+
+    for key, entry in store.iter_alerts(since=since, status=status):
+        entry["key"] = key
+        entry["archived"] = False
+        yield entry
+
+
+def write_export(records, fileobj, fmt="jsonl"):
+    """Write `records` gzipped to the binary `fileobj`. Returns the count."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+
+    count = 0
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as gz:
+        out = io.TextIOWrapper(
+            io.BufferedWriter(gz, BUFFER_SIZE), encoding="utf-8", newline=""
+        )
+        if fmt == "csv":
+            writer = csv.DictWriter(out, FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        else:
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False))
+                out.write("\n")
+                count += 1
+        out.flush()
+        out.detach()
+    return count
+
+
+def export_filename(fmt, since=None, status=None):
+    parts = ["alerts"]
+    if since:
+        parts.append(f"since-{since}")
+    if status:
+        parts.append(status)
+    return "-".join(parts) + f".{fmt}.gz"
+
+
+# ------------------- CLI -------------------
+def main(argv=None):
+    from app.config import ARCHIVE_DIR, DB_FILE
+    from app.search import parse_since
+    from app.storage import AlertStore
+
+    parser = argparse.ArgumentParser(description="Export alert history (live DB + archive)")
+    parser.add_argument("--since", help="YYYY-MM-DD, today, yesterday or Nd")
+    parser.add_argument("--status", help="pending, ignored or replied")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    since = parse_since(args.since) if args.since else None
+    if not os.path.exists(args.db):
+        parser.error(f"no database at {args.db}")
+    store = AlertStore(args.db)
+    try:
+        records = iter_alerts(store, args.archive_dir, since, args.status)
+        if args.output:
+            with open(args.output, "wb") as f:
+                count = write_export(records, f, args.format)
+        else:
+            count = write_export(records, sys.stdout.buffer, args.format)
+    finally:
+        store.close()
+    print(f"Exported {count} alerts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from functools import reduce
+
+from telegram.ext import filters
+
+from app.ttlmap import TTLMap
+
+log = logging.getLogger(__name__)
+
+# ------------------- MEDIA FOLLOW-UP -------------------
+# After someone triggers an alert, the media they post in that group for a
+# short while (a voice note explaining the problem, a screenshot...) is
+# forwarded to the alert's destination. Every (chat, user) pair has its own
+# window, so several people can be followed in one group at once, and each
+# media type has its own window length. Windows live in a TTLMap, so expiry
+# is a heap pop, not a scan.
+#
+# Albums arrive as one update per item. Items sharing a media_group_id are
+# collected for ALBUM_DELAY seconds and forwarded with one forward_messages
+# call, which also keeps them grouped on the receiving side.
+
+# Checked in this order: an animation also carries a document
+MEDIA_FILTERS = {
+    "voice": filters.VOICE,
+    "video_note": filters.VIDEO_NOTE,
+    "audio": filters.AUDIO,
+    "photo": filters.PHOTO,
+    "video": filters.VIDEO,
+    "animation": filters.ANIMATION,
+    "document": filters.Document.ALL,
+}
+
+
+def media_filter(types):
+    """Filter matching any of `types` (keys of MEDIA_FILTERS)."""
+    return reduce(lambda a, b: a | b, (MEDIA_FILTERS[t] for t in types))
+
+
+def media_type(message):
+    for name in MEDIA_FILTERS:
+        if getattr(message, name, None):
+            return name
+    return None
+
+
+class _Album:
+    __slots__ = ("bot", "dest", "thread_id", "priority", "chat_id", "message_ids", "task")
+
+    def __init__(self, bot, dest, thread_id, priority, chat_id):
+        self.bot = bot
+        self.dest = dest
+        self.thread_id = thread_id
+        self.priority = priority
+        self.chat_id = chat_id
+        self.message_ids = []
+        self.task = None
+
+
+class MediaFollow:
+    def __init__(self, sender, windows, album_delay=1.0, max_size=10000):
+        self.sender = sender
+        self.windows = dict(windows)  # media type -> seconds
+        self.album_delay = album_delay
+        # "chat:user" -> [dest, thread_id, priority, trigger time]; kept as
+        # long as the longest window, each type checks its own
+        self.entries = TTLMap(max(self.windows.values(), default=0), max_size=max_size)
+        self._albums = {}  # (chat, media_group_id) -> _Album
+
+    @property
+    def types(self):
+        return [t for t, window in self.windows.items() if window > 0]
+
+    def track(self, chat_id, user_id, dest, thread_id, priority):
+        """Start (or restart) following `user_id` in `chat_id`."""
+        if self.entries.ttl > 0:
+            self.entries[f"{chat_id}:{user_id}"] = [dest, thread_id, priority, time.time()]
+
+    def target(self, message):
+        """(dest, thread_id, priority) for a followed media message, or None."""
+        kind = media_type(message)
+        window = self.windows.get(kind, 0)
+        if window <= 0 or message.from_user is None:
+            return None
+        tracked = self.entries.get(f"{message.chat.id}:{message.from_user.id}")
+        if tracked is None:
+            return None
+        dest, thread_id, priority, since = tracked
+        if time.time() - since > window:
+            return None
+        return dest, thread_id, priority
+
+    def handle(self, bot, message):
+        """Forward `message` if its sender is being followed. Returns True if
+        it was forwarded (or added to an album that will be)."""
+        album_key = None
+        if message.media_group_id:
+            album_key = (message.chat.id, message.media_group_id)
+            album = self._albums.get(album_key)
+            if album is not None:
+                # The rest of an album that is already being forwarded
+                album.message_ids.append(message.message_id)
+                return True
+
+        target = self.target(message)
+        if target is None:
+            return False
+        dest, thread_id, priority = target
+
+        if album_key is None:
+            self.sender.submit(
+                dest,
+                lambda: bot.forward_message(
+                    chat_id=dest,
+                    from_chat_id=message.chat.id,
+                    message_id=message.message_id,
+                    message_thread_id=thread_id,
+                ),
+                priority,
+            )
+            return True
+
+        album = _Album(bot, dest, thread_id, priority, message.chat.id)
+        album.message_ids.append(message.message_id)
+        album.task = asyncio.create_task(self._forward_album_later(album_key))
+        self._albums[album_key] = album
+        return True
+
+    def expire(self):
+        return self.entries.expire()
+
+    async def close(self):
+        """Forward albums still being collected (used on shutdown)."""
+        pending = list(self._albums.items())
+        for _, album in pending:
+            album.task.cancel()
+        await asyncio.gather(*(a.task for _, a in pending), return_exceptions=True)
+        for key, album in pending:
+            self._albums.pop(key, None)
+            self._submit_album(album)
+
+    # ---------- internals ----------
+    async def _forward_album_later(self, album_key):
+        await asyncio.sleep(self.album_delay)
+        self._submit_album(self._albums.pop(album_key))
+
+    def _submit_album(self, album):
+        bot, ids = album.bot, sorted(album.message_ids)
+        self.sender.submit(
+            album.dest,
+            lambda: bot.forward_messages(
+                chat_id=album.dest,
+                from_chat_id=album.chat_id,
+                message_ids=ids,
+                message_thread_id=album.thread_id,
+            ),
+            album.priority,
+        )
+        log.info("Album of %d forwarded to %s", len(ids), album.dest)
@@ -0,0 +1,176 @@
+import importlib.util
+import logging
+
+import httpx
+from telegram.request import BaseRequest
+
+from app.config import (
+    HTTP2,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEPALIVE,
+    HTTP_MEDIA_POOL_SIZE,
+    HTTP_MEDIA_TIMEOUT,
+    HTTP_POLL_READ_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_WRITE_TIMEOUT,
+)
+from app.metrics import InstrumentedRequest
+
+log = logging.getLogger(__name__)
+
+# ------------------- HTTP CONNECTION POOLS -------------------
+# Bot API traffic is split over three connection pools, so one kind of
+# traffic can't starve another:
+#   updates  the getUpdates long poll (PTB's get_updates_request)
+#   bot      alerts, edits, callback answers and everything else
+#   media    forwards and copies of user media, which can be slow
+# A burst of forwards then waits for media connections only. Alert sends
+# and update fetching are not delayed. Each pool has its own size and
+# timeouts. Connections are kept alive between requests, and HTTP/2 can be
+# used when the h2 package is installed. Pool waits are exported as
+# bot_api_pool_wait_seconds (see app/metrics.py).
+
+MEDIA_METHODS = frozenset({
+    "forwardMessage", "forwardMessages", "copyMessage", "copyMessages",
+    "sendPhoto", "sendVideo", "sendDocument", "sendAudio", "sendVoice",
+    "sendVideoNote", "sendAnimation", "sendMediaGroup",
+})
+
+
+class MethodRouter(BaseRequest):
+    """Sends each Bot API method through the request object (pool) in
+    `routes`, or through `default`."""
+
+    def __init__(self, default, routes):
+        self.default = default
+        self.routes = dict(routes)  # API method name -> request
+
+    @property
+    def read_timeout(self):
+        return self.default.read_timeout
+
+    def _requests(self):
+        unique = {id(r): r for r in (self.default, *self.routes.values())}
+        return list(unique.values())
+
+    async def initialize(self):
+        for request in self._requests():
+            await request.initialize()
+
+    async def shutdown(self):
+        for request in self._requests():
+            await request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        request = self.routes.get(url.rsplit("/", 1)[-1], self.default)
+        return await request.do_request(url, method, request_data, **kwargs)
+
+
+class SharedRequest(BaseRequest):
+    """One request object used by several bots (see app/tenants.py). The
+    first initialize() opens it and the last shutdown() closes it."""
+
+    def __init__(self, request):
+        self.request = request
+        self.users = 0
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        self.users += 1
+        if self.users == 1:
+            await self.request.initialize()
+
+    async def shutdown(self):
+        self.users -= 1
+        if self.users == 0:
+            await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        return await self.request.do_request(url, method, request_data, **kwargs)
+
+
+def http_version(http2):
+    if not http2:
+        return "1.1"
+    if importlib.util.find_spec("h2") is None:
+        log.warning('HTTP2 is on but h2 is not installed (pip install "httpx[http2]"); using HTTP/1.1')
+        return "1.1"
+    return "2"
+
+
+def pool_request(pool, size, connect_timeout, read_timeout, write_timeout,
+                 pool_timeout, keepalive=30.0, version="1.1"):
+    return InstrumentedRequest(
+        pool=pool,
+        connection_pool_size=size,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        write_timeout=write_timeout,
+        media_write_timeout=write_timeout,
+        pool_timeout=pool_timeout,
+        http_version=version,
+        httpx_kwargs={
+            "limits": httpx.Limits(
+                max_connections=size,
+                max_keepalive_connections=size,
+                keepalive_expiry=keepalive,
+            ),
+        },
+    )
+
+
+def build_requests(
+    pool_size=16,
+    media_pool_size=8,
+    connect_timeout=10.0,
+    read_timeout=20.0,
+    write_timeout=20.0,
+    media_timeout=60.0,
+    poll_read_timeout=10.0,
+    pool_timeout=10.0,
+    keepalive=30.0,
+    http2=False,
+    updates_pool_size=2,
+):
+    """(request, get_updates_request) for ApplicationBuilder. PTB adds the
+    long-poll timeout to the getUpdates read timeout itself."""
+    version = http_version(http2)
+    bot = pool_request(
+        "bot", pool_size, connect_timeout, read_timeout, write_timeout,
+        pool_timeout, keepalive, version,
+    )
+    media = pool_request(
+        "media", media_pool_size, connect_timeout, media_timeout, media_timeout,
+        pool_timeout, keepalive, version,
+    )
+    # One long poll at a time per bot; a second connection covers the reconnect
+    updates = pool_request(
+        "updates", updates_pool_size, connect_timeout, poll_read_timeout, write_timeout,
+        pool_timeout, keepalive, version,
+    )
+    request = MethodRouter(bot, {m: media for m in MEDIA_METHODS})
+    return request, updates
+
+
+def build_requests_from_config(**overrides):
+    """build_requests() with the HTTP_* settings from app/config.py;
+    `overrides` replace single arguments (e.g. smaller pools)."""
+    kwargs = dict(
+        pool_size=HTTP_POOL_SIZE,
+        media_pool_size=HTTP_MEDIA_POOL_SIZE,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        write_timeout=HTTP_WRITE_TIMEOUT,
+        media_timeout=HTTP_MEDIA_TIMEOUT,
+        poll_read_timeout=HTTP_POLL_READ_TIMEOUT,
+        pool_timeout=HTTP_POOL_TIMEOUT,
+        keepalive=HTTP_KEEPALIVE,
+        http2=HTTP2,
+    )
+    kwargs.update(overrides)
+    return build_requests(**kwargs)
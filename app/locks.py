@@ -0,0 +1,31 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+# ------------------- PER-KEY LOCKS -------------------
+# With concurrent_updates, several updates are handled at the same time.
+# Handlers that read state, await the network and then write state back hold
+# a lock for just the key they touch (one alert, one user), so different
+# groups still run in parallel.
+
+
+class KeyedLocks:
+    def __init__(self):
+        self._locks = {}  # key -> [lock, number of holders/waiters]
+
+    @asynccontextmanager
+    async def __call__(self, key):
+        slot = self._locks.get(key)
+        if slot is None:
+            slot = self._locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                # Nobody else waiting: drop the lock so the dict stays small
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
@@ -0,0 +1,113 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+# ------------------- LOGGING -------------------
+# Handlers only put log records on a queue; a QueueListener thread formats
+# them and writes to stdout. Nothing on the event loop waits for stdout.
+#
+# Use %-style arguments (log.debug("x %s", obj)) so nothing is formatted when
+# the level is off, and Lazy(...) for values that are expensive to build.
+# High-volume debug events can be sampled with extra={"sample": True}.
+
+
+class Lazy:
+    """Wraps a zero-argument function; it only runs if the record is
+    actually formatted."""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __str__(self):
+        return str(self.fn())
+
+    __repr__ = __str__
+
+
+class SampleFilter(logging.Filter):
+    """Passes 1 in `rate` records marked with extra={"sample": True}, counted
+    per message template. Unmarked records always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counters = {}
+
+    def filter(self, record):
+        if not getattr(record, "sample", False) or self.rate == 1:
+            return True
+        counter = self._counters.get(record.msg)
+        if counter is None:
+            counter = self._counters[record.msg] = itertools.count()
+        return next(counter) % self.rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    # Attributes every LogRecord has; anything else came in via extra=
+    _STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample"}
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._STANDARD:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_listener = None
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def setup_logging(level="INFO", fmt="text", debug_sample_rate=1):
+    """Route all logging through a queue to stdout. Returns the listener.
+    Calling it again replaces the previous setup (app/tenants.py loads the
+    bot once per tenant)."""
+    global _listener
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    # QueueHandler.prepare() renders the message (args, Lazy values) in the
+    # calling thread, but only for records that passed the level check
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SampleFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    # httpx logs every Bot API request at INFO, httpcore every socket event
+    # at DEBUG; our own DEBUG shouldn't turn those on
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("httpcore").setLevel(logging.WARNING)
+
+    if _listener is None:
+        atexit.register(_stop_listener)
+    else:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
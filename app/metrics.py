@@ -0,0 +1,272 @@
+import asyncio
+import functools
+import logging
+import time
+from datetime import datetime, timezone
+
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+log = logging.getLogger(__name__)
+
+# ------------------- METRICS -------------------
+# Tiny Prometheus-format registry (counters, gauges, histograms) served over
+# plain HTTP on a local port. No extra dependency needed.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=(), register=True):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        if register:
+            REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_labels_text(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """Value read from a function at scrape time. Registering the same name
+    again adds another function; the gauge reports their sum (one per
+    tenant when several bots share the process, see app/tenants.py)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        existing = next(
+            (m for m in REGISTRY if m.name == name and isinstance(m, Gauge)), None
+        )
+        super().__init__(name, help_text, register=existing is None)
+        self.fns = existing.fns if existing is not None else []
+        self.fns.append(fn)
+
+    def _samples(self):
+        try:
+            value = sum(fn() for fn in self.fns)
+        except Exception:
+            return
+        yield f"{self.name} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[i] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def _samples(self):
+        for key, data in self._values.items():
+            for bound, count in zip(self.buckets, data):
+                labels = _labels_text(self.labelnames, key, [("le", bound)])
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _labels_text(self.labelnames, key, [("le", "+Inf")])
+            yield f"{self.name}_bucket{labels} {data[-1]}"
+            yield f"{self.name}_sum{_labels_text(self.labelnames, key)} {data[-2]}"
+            yield f"{self.name}_count{_labels_text(self.labelnames, key)} {data[-1]}"
+
+
+def render():
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ------------------- BOT METRICS -------------------
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Time spent in each handler or job", ("handler",)
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Handler calls that raised", ("handler",)
+)
+UPDATE_LAG_SECONDS = Histogram(
+    "bot_update_lag_seconds",
+    "Delay between a message's date and the moment a handler picked it up",
+    buckets=LAG_BUCKETS,
+)
+TRIGGER_HITS = Counter(
+    "bot_trigger_hits_total", "Trigger word matches", ("kind", "word")
+)
+ALERTS = Counter(
+    "bot_alerts_total", "Alerts created, by destination chat", ("dest",)
+)
+ALERTS_COALESCED = Counter(
+    "bot_alerts_coalesced_total",
+    "Triggers merged into an already sent alert instead of a new one",
+    ("dest",),
+)
+API_SECONDS = Histogram(
+    "bot_api_request_seconds", "Telegram Bot API request time", ("method",)
+)
+API_ERRORS = Counter(
+    "bot_api_errors_total", "Telegram Bot API requests that failed", ("method",)
+)
+API_POOL_WAIT_SECONDS = Histogram(
+    "bot_api_pool_wait_seconds",
+    "Time a Bot API request waited for a free connection, by pool",
+    ("pool",),
+)
+API_POOL_TIMEOUTS = Counter(
+    "bot_api_pool_timeouts_total",
+    "Bot API requests that gave up waiting for a connection, by pool",
+    ("pool",),
+)
+DB_FLUSH_SECONDS = Histogram(
+    "bot_db_flush_seconds", "Time spent writing a batch to the alert DB"
+)
+DB_FLUSH_ROWS = Counter("bot_db_flush_rows_total", "Rows written or deleted by DB flushes")
+
+
+async def record_update_lag(update, context):
+    """Registered as a TypeHandler in group -1, so it sees each update once.
+    Only new messages count: a callback query or an edit carries the date of
+    the original message, not of the update."""
+    message = update.message or update.channel_post
+    if message is not None and message.date is not None:
+        lag = (datetime.now(timezone.utc) - message.date).total_seconds()
+        UPDATE_LAG_SECONDS.observe(max(lag, 0.0))
+
+
+def timed(callback, name=None):
+    """Wrap a handler/job callback to record its latency and errors."""
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await callback(update, *args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name)
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the duration of every Bot API call, and how
+    long each call waited for a connection from its pool (`pool` names it in
+    the metrics)."""
+
+    def __init__(self, *args, pool="bot", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+        self.pool_size = kwargs.get("connection_pool_size", 1)
+        self.pool_timeout = kwargs.get("pool_timeout", 1.0)
+        # Admits as many requests as httpx has connections, so the time
+        # spent waiting here is the pool wait
+        self._slots = asyncio.Semaphore(self.pool_size)
+        self.in_flight = 0
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        pool_timeout = kwargs.get("pool_timeout")
+        if not isinstance(pool_timeout, (int, float)):  # DEFAULT_NONE
+            pool_timeout = self.pool_timeout
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), pool_timeout)
+        except asyncio.TimeoutError:
+            API_POOL_TIMEOUTS.inc(pool=self.pool)
+            API_ERRORS.inc(method=api_method)
+            raise TimedOut(f"Pool timeout: no free connection in the {self.pool} pool") from None
+        API_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, pool=self.pool)
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, **kwargs)
+        except Exception:
+            API_ERRORS.inc(method=api_method)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, method=api_method)
+            self.in_flight -= 1
+            self._slots.release()
+
+
+# ------------------- HTTP ENDPOINT -------------------
+async def _handle(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Drain the headers; we don't need them
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host, port):
+    server = await asyncio.start_server(_handle, host, port)
+    log.info("Metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,138 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from telegram import InlineKeyboardMarkup
+
+log = logging.getLogger(__name__)
+
+# ------------------- OUTBOX -------------------
+# Every alert send and reply forward is written here before it is attempted,
+# under an idempotency key derived from the source message ("alert:<key>",
+# "forward:<user>:<message_id>"). The row is marked sent once Telegram
+# accepts it. After a crash, rows still pending are sent again on startup
+# (at-least-once), and an update Telegram delivers a second time finds its
+# key already claimed, so it doesn't produce a duplicate alert.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key        TEXT PRIMARY KEY,
+    kind       TEXT,
+    chat_id    INTEGER,
+    payload    TEXT,
+    state      TEXT,
+    created    REAL,
+    updated    REAL,
+    message_id INTEGER,
+    error      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, updated);
+"""
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class Outbox:
+    """Blocking SQLite calls; use asyncio.to_thread() from the event loop."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Survives a process crash, which is what the restart loop is about
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def claim(self, key, kind, chat_id, payload):
+        """Record an action before it is attempted. False if `key` was
+        already claimed (sent, failed, or pending replay)."""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (key, kind, chat_id, payload, state, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, chat_id, json.dumps(payload, ensure_ascii=False), PENDING, now, now),
+            )
+        return cur.rowcount > 0
+
+    def _set_state(self, key, state, message_id=None, error=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET state = ?, updated = ?, message_id = ?, error = ? WHERE key = ?",
+                (state, time.time(), message_id, error, key),
+            )
+
+    def done(self, key, message_id=None):
+        self._set_state(key, SENT, message_id=message_id)
+
+    def failed(self, key, error):
+        self._set_state(key, FAILED, error=error)
+
+    def pending(self):
+        """(key, kind, chat_id, payload) of every undelivered action, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, kind, chat_id, payload FROM outbox WHERE state = ? ORDER BY created",
+                (PENDING,),
+            ).fetchall()
+        return [(k, kind, chat, json.loads(p)) for k, kind, chat, p in rows]
+
+    def prune(self, keep_seconds):
+        """Forget finished actions older than `keep_seconds`. They only need
+        to outlive Telegram's redelivery of the update that caused them."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE state != ? AND updated < ?",
+                (PENDING, time.time() - keep_seconds),
+            )
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ------------------- ACTIONS -------------------
+def alert_payload(chat_id, text, reply_markup=None, thread_id=None, quiet=False):
+    return {
+        "chat_id": chat_id,
+        "text": text,
+        "reply_markup": reply_markup.to_dict() if reply_markup else None,
+        "thread_id": thread_id,
+        "quiet": quiet,
+    }
+
+
+def forward_payload(chat_id, from_chat_id, message_id, alert_key):
+    return {
+        "chat_id": chat_id,
+        "from_chat_id": from_chat_id,
+        "message_id": message_id,
+        "alert_key": alert_key,
+    }
+
+
+async def perform(bot, kind, payload):
+    """Do the Bot API call an outbox row describes."""
+    if kind == "alert":
+        markup = payload.get("reply_markup")
+        return await bot.send_message(
+            chat_id=payload["chat_id"],
+            text=payload["text"],
+            reply_markup=InlineKeyboardMarkup.de_json(markup, bot) if markup else None,
+            message_thread_id=payload.get("thread_id"),
+            disable_notification=payload.get("quiet", False),
+        )
+    if kind == "forward":
+        return await bot.forward_message(
+            chat_id=payload["chat_id"],
+            from_chat_id=payload["from_chat_id"],
+            message_id=payload["message_id"],
+        )
+    raise ValueError(f"unknown outbox action {kind!r}")
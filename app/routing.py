@@ -0,0 +1,286 @@
+import json
+import os
+import weakref
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from telegram import MessageEntity
+
+from app.triggers import TriggerMatcher
+
+# ------------------- ROUTING TABLE -------------------
+# Compiled once per source group: its trigger matcher, destinations, topic
+# and quiet hours. A message costs one dict lookup on its chat_id plus one
+# match against that chat's rules. Groups without their own entry share the
+# default rules built from the global triggers. The table is immutable; a
+# reload builds a new one and swaps the reference.
+#
+# The trigger settings can also come from a JSON file (ROUTING_FILE), which
+# replaces the matching values from app/config.py and can be reloaded while
+# the bot runs:
+#
+#   {
+#     "to_boss": ["plan", "production"],
+#     "to_group": ["yang"],
+#     "boss_usernames": ["kiengyang"],
+#     "routes": {"option": {"boss_chat": -100111, "thread_id": 7}},
+#     "chats": {"-100222": {"to_boss": ["deploy"], "quiet_hours": [22, 7]}}
+#   }
+
+FILE_KEYS = ("to_boss", "to_group", "boss_usernames", "routes", "chats")
+CHAT_KEYS = (
+    "to_boss", "to_group", "routes", "boss_chat", "group_chat", "thread_id",
+    "quiet_hours", "mentions",
+)
+
+
+# Compiled matchers, shared by every routing table (and every tenant, see
+# app/tenants.py) with the same trigger settings
+_matchers = weakref.WeakValueDictionary()
+
+
+class Decision(NamedTuple):
+    dest: int
+    thread_id: Optional[int]
+    route: Optional[dict]  # the ROUTES entry that decided, if any
+    quiet: bool  # inside the group's quiet hours: deliver silently
+
+
+def in_quiet_hours(quiet_hours, now=None):
+    """quiet_hours = (start_hour, end_hour) in local time; may wrap midnight."""
+    if not quiet_hours:
+        return False
+    start, end = quiet_hours
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def mentions(message, usernames, user_ids):
+    """True if the message @mentions one of `usernames` or text-mentions one
+    of `user_ids`. Uses the entity offsets, not a scan of the text."""
+    if not message.entities:
+        return False
+    for entity in message.entities:
+        if entity.type == MessageEntity.TEXT_MENTION:
+            if entity.user is not None and entity.user.id in user_ids:
+                return True
+        elif entity.type == MessageEntity.MENTION:
+            # parse_entity handles Telegram's UTF-16 offsets
+            if message.parse_entity(entity)[1:].lower() in usernames:
+                return True
+    return False
+
+
+class ChatRules:
+    __slots__ = (
+        "matcher", "boss_chat", "group_chat", "thread_id", "quiet_hours",
+        "usernames", "user_ids",
+    )
+
+    def __init__(self, matcher, boss_chat, group_chat, thread_id=None,
+                 quiet_hours=None, usernames=(), user_ids=()):
+        self.matcher = matcher
+        self.boss_chat = boss_chat
+        self.group_chat = group_chat
+        self.thread_id = thread_id
+        self.quiet_hours = tuple(quiet_hours) if quiet_hours else None
+        self.usernames = frozenset(u.lstrip("@").lower() for u in usernames)
+        self.user_ids = frozenset(user_ids)
+
+    def decide(self, message, hits):
+        """Where an alert for `message` goes, given its trigger hits (sorted
+        by priority). None if nothing triggered."""
+        quiet = in_quiet_hours(self.quiet_hours)
+
+        # 1) ROUTES-based triggers win
+        for h in hits:
+            if h.kind == "route":
+                return Decision(h.route["boss_chat"], h.route.get("thread_id"), h.route, quiet)
+
+        # 2) Boss mention, then legacy boss/group triggers
+        if mentions(message, self.usernames, self.user_ids) or any(
+            h.kind == "boss" for h in hits
+        ):
+            return Decision(self.boss_chat, self.thread_id, None, quiet)
+        if any(h.kind == "group" for h in hits):
+            return Decision(self.group_chat, self.thread_id, None, quiet)
+        return None
+
+
+class RoutingTable:
+    def __init__(self, default, chats):
+        self.default = default
+        self.chats = chats  # source chat_id -> ChatRules
+
+    def rules_for(self, chat_id):
+        return self.chats.get(chat_id, self.default)
+
+
+def build_routing(
+    routes,
+    to_boss,
+    to_group,
+    boss_chat,
+    group_chat,
+    chat_routes=None,
+    boss_usernames=(),
+    word_boundary=False,
+    casefold=False,
+):
+    """Compile the global triggers and every CHAT_ROUTES entry. Groups that
+    share the same trigger lists share one compiled matcher."""
+    compiled = {}
+
+    def matcher_for(r, b, g):
+        key = (repr(r), tuple(b), tuple(g), word_boundary, casefold)
+        if key not in compiled:
+            matcher = _matchers.get(key)
+            if matcher is None:
+                matcher = TriggerMatcher(
+                    r, b, g, word_boundary=word_boundary, casefold=casefold
+                )
+                _matchers[key] = matcher
+            compiled[key] = matcher
+        return compiled[key]
+
+    user_ids = {boss_chat} if boss_chat else set()
+    default = ChatRules(
+        matcher_for(routes, to_boss, to_group),
+        boss_chat,
+        group_chat,
+        usernames=boss_usernames,
+        user_ids=user_ids,
+    )
+
+    chats = {}
+    for chat_id, cfg in (chat_routes or {}).items():
+        chats[int(chat_id)] = ChatRules(
+            matcher_for(
+                cfg.get("routes", routes),
+                cfg.get("to_boss", to_boss),
+                cfg.get("to_group", to_group),
+            ),
+            cfg.get("boss_chat", boss_chat),
+            cfg.get("group_chat", group_chat),
+            thread_id=cfg.get("thread_id"),
+            quiet_hours=cfg.get("quiet_hours"),
+            usernames=cfg.get("mentions", boss_usernames),
+            user_ids=user_ids,
+        )
+    return RoutingTable(default, chats)
+
+
+# ------------------- ROUTING FILE -------------------
+def _check_words(value, where):
+    if not isinstance(value, list) or not all(isinstance(w, str) for w in value):
+        raise ValueError(f"{where} must be a list of strings")
+    return value
+
+
+def _check_int(value, where, optional=True):
+    if value is None and optional:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{where} must be an integer")
+    return value
+
+
+def _check_routes(value, where):
+    if not isinstance(value, dict):
+        raise ValueError(f"{where} must be an object")
+    routes = {}
+    for word, info in value.items():
+        if not isinstance(info, dict):
+            raise ValueError(f"{where}.{word} must be an object")
+        _check_int(info.get("boss_chat"), f"{where}.{word}.boss_chat", optional=False)
+        _check_int(info.get("thread_id"), f"{where}.{word}.thread_id")
+        _check_int(info.get("coalesce_window"), f"{where}.{word}.coalesce_window")
+        routes[word] = dict(info)
+    return routes
+
+
+def _check_chat(value, where):
+    if not isinstance(value, dict):
+        raise ValueError(f"{where} must be an object")
+    unknown = set(value) - set(CHAT_KEYS)
+    if unknown:
+        raise ValueError(f"{where}: unknown keys {sorted(unknown)}")
+    cfg = dict(value)
+    for key in ("to_boss", "to_group", "mentions"):
+        if key in cfg:
+            _check_words(cfg[key], f"{where}.{key}")
+    if "routes" in cfg:
+        cfg["routes"] = _check_routes(cfg["routes"], f"{where}.routes")
+    for key in ("boss_chat", "group_chat", "thread_id"):
+        _check_int(cfg.get(key), f"{where}.{key}")
+    quiet = cfg.get("quiet_hours")
+    if quiet is not None:
+        if (
+            not isinstance(quiet, list)
+            or len(quiet) != 2
+            or not all(isinstance(h, int) and 0 <= h <= 24 for h in quiet)
+        ):
+            raise ValueError(f"{where}.quiet_hours must be [start_hour, end_hour]")
+    return cfg
+
+
+def parse_routing_config(data):
+    """Validate the contents of a routing file. Returns the settings it sets
+    (a subset of FILE_KEYS); raises ValueError saying what is wrong."""
+    if not isinstance(data, dict):
+        raise ValueError("routing file must contain a JSON object")
+    unknown = set(data) - set(FILE_KEYS)
+    if unknown:
+        raise ValueError(f"unknown keys {sorted(unknown)}")
+
+    cfg = {}
+    for key in ("to_boss", "to_group", "boss_usernames"):
+        if key in data:
+            cfg[key] = _check_words(data[key], key)
+    if "routes" in data:
+        cfg["routes"] = _check_routes(data["routes"], "routes")
+    if "chats" in data:
+        if not isinstance(data["chats"], dict):
+            raise ValueError("chats must be an object")
+        chats = {}
+        for chat_id, chat_cfg in data["chats"].items():
+            try:
+                chat_key = int(chat_id)
+            except ValueError:
+                raise ValueError(f"chats: {chat_id!r} is not a chat id") from None
+            chats[chat_key] = _check_chat(chat_cfg, f"chats.{chat_id}")
+        cfg["chats"] = chats
+    return cfg
+
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def load_routing(path, defaults, boss_chat, group_chat, word_boundary=False, casefold=False):
+    """Read the routing file at `path` (if there is one) over `defaults` (a
+    dict with FILE_KEYS) and compile it. Returns (table, file mtime).
+    Blocking: call it with asyncio.to_thread() from the event loop."""
+    cfg = dict(defaults)
+    mtime = file_mtime(path) if path else None
+    if mtime is not None:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg.update(parse_routing_config(json.load(f)))
+
+    table = build_routing(
+        cfg["routes"],
+        cfg["to_boss"],
+        cfg["to_group"],
+        boss_chat=boss_chat,
+        group_chat=group_chat,
+        chat_routes=cfg["chats"],
+        boss_usernames=cfg["boss_usernames"],
+        word_boundary=word_boundary,
+        casefold=casefold,
+    )
+    return table, mtime
@@ -0,0 +1,54 @@
+import shlex
+from datetime import date, datetime, timedelta
+
+# ------------------- SEARCH QUERIES -------------------
+# /search <terms> [from:sender] [group:title] [since:date]
+# Turned into an FTS5 MATCH expression for the index in app/storage.py.
+# Every word is a prefix match ("prod" finds "production"); quote several
+# words to search for them as a phrase: from:"Ann Lee".
+
+FILTERS = {"from": "sender", "group": "group_title"}
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"*'
+
+
+def parse_since(value):
+    """'2024-05-01', 'today', 'yesterday' or '7d' -> ISO date string."""
+    value = value.lower()
+    if value == "today":
+        return date.today().isoformat()
+    if value == "yesterday":
+        return (date.today() - timedelta(days=1)).isoformat()
+    if value.endswith("d") and value[:-1].isdigit():
+        return (date.today() - timedelta(days=int(value[:-1]))).isoformat()
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise ValueError(f"since: expects YYYY-MM-DD, today, yesterday or Nd, not {value!r}") from None
+
+
+def parse_query(query):
+    """Returns (match expression, since date or None). Raises ValueError
+    for an empty or malformed query."""
+    try:
+        tokens = shlex.split(query)
+    except ValueError:
+        tokens = query.replace('"', " ").split()
+
+    parts = []
+    since = None
+    for token in tokens:
+        name, sep, value = token.partition(":")
+        name = name.lower()
+        if sep and name == "since":
+            since = parse_since(value)
+        elif sep and name in FILTERS and value:
+            parts.append(f"{FILTERS[name]} : {_phrase(value)}")
+        elif token.strip():
+            parts.append(_phrase(token))
+
+    if not parts:
+        raise ValueError("give at least one word, from: or group:")
+    return " AND ".join(parts), since
@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+# ------------------- OUTBOUND SEND QUEUE -------------------
+# Alerts are not sent from inside the handlers any more. They are queued
+# here and sent by a few worker tasks that respect Telegram's flood limits:
+# one token bucket for the whole bot and one per destination chat. A
+# RetryAfter from Telegram pauses only that chat, then the send is retried.
+
+log = logging.getLogger(__name__)
+
+PRIORITY_BOSS = 0
+PRIORITY_GROUP = 10
+PRIORITY_DIGEST = 20
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until one token is available (0 if available now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+def _mark_retrieved(future):
+    # Failures are already logged by the worker; callers that don't await
+    # the future shouldn't get "exception was never retrieved" warnings.
+    if not future.cancelled():
+        future.exception()
+
+
+def _retry_seconds(exc):
+    value = exc.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class SendQueue:
+    def __init__(
+        self,
+        global_rate=25.0,
+        chat_rate=1.0,
+        chat_burst=3,
+        workers=4,
+        max_attempts=5,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_attempts = max_attempts
+
+        self._chat_buckets = {}
+        self._paused_until = {}  # chat_id -> monotonic time (RetryAfter)
+        self._queue = None
+        self._tasks = []
+        self._seq = itertools.count()
+        self._deferred = 0
+
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.flood_waits = 0
+
+    # ---------- public ----------
+    def submit(self, chat_id, call, priority=PRIORITY_GROUP, future=None):
+        """Queue `call` (a zero-argument coroutine function doing the actual
+        API call) for `chat_id`. Returns a future with the call's result
+        (`future` if given, for callers that need it before queueing)."""
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_mark_retrieved)
+        self._put((priority, next(self._seq), chat_id, call, future, 1))
+        return future
+
+    def send_message(self, bot, chat_id, text, priority=PRIORITY_GROUP, **kwargs):
+        return self.submit(
+            chat_id,
+            lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs),
+            priority,
+        )
+
+    def depth(self):
+        """Items waiting to be sent, including ones held back by a bucket."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + self._deferred
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "deferred": self._deferred,
+            "sent": self.sent,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "flood_waits": self.flood_waits,
+            "paused_chats": sum(
+                1 for t in self._paused_until.values() if t > time.monotonic()
+            ),
+        }
+
+    # ---------- lifecycle ----------
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def close(self, timeout=10.0):
+        """Give queued sends a moment to go out, then stop the workers."""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                log.warning("Send queue closed with %d items unsent.", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- internals ----------
+    async def _drain(self):
+        # join() alone misses items held back by a bucket (see _defer)
+        while True:
+            await self._queue.join()
+            if not self._deferred:
+                return
+            await asyncio.sleep(0.05)
+
+    def _put(self, item):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._queue.put_nowait(item)
+
+    def _defer(self, item, delay):
+        def requeue():
+            self._deferred -= 1
+            self._put(item)
+
+        self._deferred += 1
+        asyncio.get_running_loop().call_later(delay, requeue)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _wait_time(self, chat_id, now):
+        paused = self._paused_until.get(chat_id, 0) - now
+        if paused > 0:
+            return paused
+        return self._chat_bucket(chat_id).delay(now)
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._process(item)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, item):
+        priority, seq, chat_id, call, future, attempt = item
+        if future.done():  # cancelled by the caller
+            return
+
+        now = time.monotonic()
+        wait = self._wait_time(chat_id, now)
+        if wait > 0:
+            # Don't block the worker on one busy chat
+            self._defer(item, wait)
+            return
+
+        global_wait = self.global_bucket.delay(now)
+        if global_wait > 0:
+            await asyncio.sleep(global_wait)
+            now = time.monotonic()
+
+        self.global_bucket.take(now)
+        self._chat_bucket(chat_id).take(now)
+
+        try:
+            result = await call()
+        except RetryAfter as e:
+            seconds = _retry_seconds(e)
+            self.flood_waits += 1
+            self._paused_until[chat_id] = time.monotonic() + seconds
+            log.warning("Flood limit for chat %s: retrying in %.0fs", chat_id, seconds)
+            self._retry(item, seconds, e)
+        except BadRequest as e:
+            # A subclass of NetworkError, but sending it again won't help
+            self.dropped += 1
+            log.error("Send to %s rejected: %r", chat_id, e)
+            future.set_exception(e)
+        except (TimedOut, NetworkError) as e:
+            self._retry(item, min(2 ** attempt, 30), e)
+        except Exception as e:
+            self.dropped += 1
+            log.error("Send to %s failed: %r", chat_id, e)
+            future.set_exception(e)
+        else:
+            self.sent += 1
+            future.set_result(result)
+
+    def _retry(self, item, delay, exc):
+        priority, seq, chat_id, call, future, attempt = item
+        if attempt >= self.max_attempts:
+            self.dropped += 1
+            log.error("Giving up on send to %s after %d attempts: %r", chat_id, attempt, exc)
+            future.set_exception(exc)
+            return
+        self.retried += 1
+        self._defer((priority, seq, chat_id, call, future, attempt + 1), delay)
@@ -0,0 +1,323 @@
+"""
+Sharded mode: one ingress process, SHARDS worker processes.
+
+    SHARDS=4 python -m app.shard
+
+The ingress receives updates (polling or webhook, as BOT_MODE says) and
+does nothing else with them: it works out which worker owns each one and
+puts it on that worker's queue (a multiprocessing.Queue, so no broker is
+needed). Each worker is a full bot (app/bot.py) without an Updater. It
+caches only its own chats' alerts and writes them to the shared SQLite DB.
+
+Who owns what:
+  - group updates go to the worker of chat_id % SHARDS, so one chat's
+    messages, bursts and media follow-up stay in one process
+  - alert buttons (ignore / toggle / reply) go to the worker that owns the
+    alert key; the ingress remembers who pressed Reply, so that user's next
+    private message reaches the same worker
+  - other private messages and commands go to worker 0, which also runs the
+    daily summary; /clear_today, /clear_all, /reload and /queue go to every
+    worker
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from app.config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    LOG_DEBUG_SAMPLE,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    METRICS_PORT,
+    OUTBOX_FILE,
+    REPLY_MODE_TTL,
+    SEND_CHAT_RATE,
+    SEND_GLOBAL_RATE,
+    SHARDS,
+    STATE_FILE,
+    TELEGRAM_BASE_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from app.http import build_requests_from_config
+from app.log import setup_logging
+from app.ttlmap import TTLMap, load_snapshot, snapshot_maps, write_snapshot
+
+log = logging.getLogger(__name__)
+
+# Alert buttons whose data is "<action>|<alert key>"
+KEY_ACTIONS = ("ignore", "toggle", "reply")
+# Commands every worker has to see
+BROADCAST_COMMANDS = ("clear_today", "clear_all", "reload", "queue")
+# How long the ingress waits for a worker to finish its queue on shutdown
+STOP_TIMEOUT = 30
+
+
+# ------------------- SHARD ROUTING -------------------
+def shard_of_chat(chat_id, shards):
+    return chat_id % shards
+
+
+def key_chat(key):
+    """Source chat of an alert key ("<chat_id>_<message_id>")."""
+    return int(key.rsplit("_", 1)[0])
+
+
+def owns_key(index, shards):
+    """Key predicate for the AlertCache of worker `index`."""
+    def owns(key):
+        try:
+            return shard_of_chat(key_chat(key), shards) == index
+        except ValueError:
+            return index == 0
+    return owns
+
+
+def shard_path(path, name):
+    """app/state.json -> app/state.<name>.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+
+def _command(text):
+    if not text or not text.startswith("/"):
+        return None
+    return text.split()[0][1:].split("@")[0].lower()
+
+
+def route(update, shards, replying):
+    """Worker indexes `update` goes to. `replying` maps user id -> worker
+    for users who pressed Reply; it is updated here."""
+    query = update.callback_query
+    if query is not None:
+        action, _, key = (query.data or "").partition("|")
+        if action in KEY_ACTIONS:
+            try:
+                index = shard_of_chat(key_chat(key), shards)
+            except ValueError:
+                return [0]
+            if action == "reply":
+                replying[query.from_user.id] = index
+            return [index]
+        # Summary and search paging
+        return [0]
+
+    chat = update.effective_chat
+    if chat is None:
+        return [0]
+    if chat.type != "private":
+        return [shard_of_chat(chat.id, shards)]
+
+    message = update.effective_message
+    command = _command(message.text if message else None)
+    if command in BROADCAST_COMMANDS:
+        return list(range(shards))
+    if command is None and update.effective_user is not None:
+        return [replying.get(update.effective_user.id, 0)]
+    return [0]
+
+
+# ------------------- WORKER -------------------
+def run_worker(queue):
+    """Entry point of a worker process (spawned; SHARD_INDEX is in its env)."""
+    # Ctrl-C reaches the whole process group; the ingress decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_main(queue))
+
+
+async def _worker_main(queue):
+    from app import bot
+
+    app = bot.build_app()
+    await app.initialize()
+    # run_polling() would call these; a worker has no Updater
+    await bot.post_init(app)
+    await app.start()
+    try:
+        while True:
+            data = await asyncio.to_thread(queue.get)
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+        # Application.stop() drops what is still queued
+        await app.update_queue.join()
+    finally:
+        await app.stop()
+        await bot.post_shutdown(app)
+        await app.shutdown()
+
+
+def _worker_env(index):
+    """Settings that differ per worker. The DB and search index are shared;
+    state, outbox and metrics port are per worker, and the send rates are
+    split so all workers together stay within Telegram's limits."""
+    env = {
+        "SHARDS": str(SHARDS),
+        "SHARD_INDEX": str(index),
+        "STATE_FILE": shard_path(STATE_FILE, f"shard{index}"),
+        "OUTBOX_FILE": shard_path(OUTBOX_FILE, f"shard{index}"),
+        "METRICS_PORT": str(METRICS_PORT + 1 + index if METRICS_PORT else 0),
+        "SEND_GLOBAL_RATE": str(SEND_GLOBAL_RATE / SHARDS),
+        "SEND_CHAT_RATE": str(SEND_CHAT_RATE / SHARDS),
+        # The ingress has already imported it (see _prepare_db)
+        "LEGACY_DB_FILE": "",
+    }
+    return env
+
+
+class Workers:
+    def __init__(self, shards):
+        self.shards = shards
+        self.ctx = multiprocessing.get_context("spawn")
+        self.queues = [self.ctx.Queue() for _ in range(shards)]
+        self.procs = [None] * shards
+
+    def start(self, index):
+        proc = self.ctx.Process(
+            target=run_worker, args=(self.queues[index],), name=f"shard-{index}", daemon=False
+        )
+        # A spawned child reads its config from the environment it starts with
+        saved = dict(os.environ)
+        os.environ.update(_worker_env(index))
+        try:
+            proc.start()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+        self.procs[index] = proc
+        log.info("Started worker %d (pid %s)", index, proc.pid)
+
+    def start_all(self):
+        for index in range(self.shards):
+            self.start(index)
+
+    def put(self, index, data):
+        self.queues[index].put(data)
+
+    def restart_dead(self):
+        for index, proc in enumerate(self.procs):
+            if proc is not None and not proc.is_alive():
+                log.error("Worker %d exited with code %s, restarting", index, proc.exitcode)
+                self.start(index)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Let every worker finish its queue, then stop it."""
+        for queue in self.queues:
+            queue.put(None)
+        for index, proc in enumerate(self.procs):
+            if proc is None:
+                continue
+            proc.join(timeout)
+            if proc.is_alive():
+                log.warning("Worker %d did not stop in %ss, terminating", index, timeout)
+                proc.terminate()
+                proc.join()
+
+
+# ------------------- INGRESS -------------------
+workers = None
+# user id -> worker that holds their reply mode
+replying = TTLMap(REPLY_MODE_TTL)
+REPLYING_FILE = shard_path(STATE_FILE, "ingress")
+
+
+async def dispatch(update, context):
+    for index in route(update, workers.shards, replying):
+        workers.put(index, update.to_dict())
+
+
+async def save_replying(context):
+    if replying.dirty:
+        replying.expire()
+        data = snapshot_maps({"replying": replying})
+        await asyncio.to_thread(write_snapshot, REPLYING_FILE, data)
+
+
+async def watch_workers(context):
+    workers.restart_dead()
+
+
+def _prepare_db():
+    """Create/migrate the shared DB and search index once, before the
+    workers open them at the same time."""
+    from app.config import DB_FILE, LEGACY_DB_FILE, SEARCH_DB_FILE
+    from app.storage import AlertStore
+
+    AlertStore(DB_FILE, legacy_json=LEGACY_DB_FILE, search_path=SEARCH_DB_FILE or None).close()
+
+
+async def post_init(application):
+    global workers
+    load_snapshot(REPLYING_FILE, {"replying": replying})
+    await asyncio.to_thread(_prepare_db)
+    workers = Workers(SHARDS)
+    workers.start_all()
+
+
+async def post_shutdown(application):
+    if workers is not None:
+        await asyncio.to_thread(workers.stop)
+    data = snapshot_maps({"replying": replying})
+    await asyncio.to_thread(write_snapshot, REPLYING_FILE, data)
+
+
+def build_ingress():
+    """Application that only receives updates and hands them to workers.
+    Updates are dispatched one at a time, in the order they arrive."""
+    request, get_updates_request = build_requests_from_config(pool_size=4, media_pool_size=1)
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(request)
+        .get_updates_request(get_updates_request)
+        .concurrent_updates(False)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(f"{TELEGRAM_BASE_URL}/bot").base_file_url(
+            f"{TELEGRAM_BASE_URL}/file/bot"
+        )
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, dispatch))
+    app.job_queue.run_repeating(save_replying, interval=10, first=10)
+    app.job_queue.run_repeating(watch_workers, interval=5, first=5)
+    return app
+
+
+def main():
+    setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE)
+    if SHARDS < 2:
+        log.error("SHARDS is %d; run python -m app.bot for a single process", SHARDS)
+        return 1
+
+    app = build_ingress()
+    if BOT_MODE == "webhook":
+        log.info("✅ Ingress running (webhook on %s:%s/%s), %d workers...",
+                 WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, SHARDS)
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        log.info("✅ Ingress running, %d workers...", SHARDS)
+        app.run_polling()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
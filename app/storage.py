@@ -0,0 +1,669 @@
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.metrics import DB_FLUSH_ROWS, DB_FLUSH_SECONDS
+
+log = logging.getLogger(__name__)
+
+# ------------------- ALERT STORE -------------------
+# SQLite (WAL mode) replacement for the old whole-file app/db.json.
+# Every alert is one row keyed by "<group_id>_<message_id>", so inserts and
+# status changes only touch that row and its index entries.
+
+COLUMNS = (
+    "group_id",
+    "group_title",
+    "group_username",
+    "message_id",
+    "text",
+    "sender",
+    "time",
+    "status",
+    "burst",  # key of the alert this one was coalesced into, if any
+    "dest",  # chat the alert was sent to (None = boss, for older alerts)
+    "thread_id",  # topic in that chat
+)
+
+# SQL types of the columns added after the first release
+NEW_COLUMNS = {"burst": "TEXT", "dest": "INTEGER", "thread_id": "INTEGER"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    key            TEXT PRIMARY KEY,
+    group_id       INTEGER,
+    group_title    TEXT,
+    group_username TEXT,
+    message_id     INTEGER,
+    text           TEXT,
+    sender         TEXT,
+    time           TEXT,
+    status         TEXT,
+    burst          TEXT,
+    dest           INTEGER,
+    thread_id      INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_status ON alerts (status);
+CREATE INDEX IF NOT EXISTS idx_alerts_time ON alerts (time);
+CREATE INDEX IF NOT EXISTS idx_alerts_group_msg ON alerts (group_id, message_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# ------------------- SEARCH INDEX -------------------
+# Full-text (FTS5) index over alert text, sender and group title, kept in a
+# separate database file attached to the same connection, so the live DB
+# stays small. It is updated in the same write_batch() as the alerts table.
+# Alerts moved to the archive stay in the index (archived = 1), so /search
+# covers the whole history without reading the gzip segments.
+
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search.docs (
+    id             INTEGER PRIMARY KEY,
+    key            TEXT UNIQUE,
+    group_id       INTEGER,
+    group_title    TEXT,
+    group_username TEXT,
+    message_id     INTEGER,
+    sender         TEXT,
+    time           TEXT,
+    status         TEXT,
+    archived       INTEGER DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search.fts USING fts5(
+    text, sender, group_title, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS search.meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class AlertStore:
+    """Small wrapper around the alerts table. Entries are plain dicts with the
+    same fields the JSON file used to hold."""
+
+    def __init__(self, path, legacy_json=None, search_path=None):
+        self.path = path
+        self.search_path = search_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        if search_path:
+            self._conn.execute("ATTACH DATABASE ? AS search", (search_path,))
+            self._conn.execute("PRAGMA search.journal_mode=WAL")
+            self._conn.executescript(SEARCH_SCHEMA)
+        self._conn.commit()
+
+        if legacy_json:
+            self.migrate_json(legacy_json)
+        if search_path:
+            self._index_live_rows()
+
+    # ---------- migration ----------
+    def _add_missing_columns(self):
+        """Databases created by older versions lack the newer columns."""
+        have = {r["name"] for r in self._conn.execute("PRAGMA table_info(alerts)")}
+        for column, sql_type in NEW_COLUMNS.items():
+            if column not in have:
+                self._conn.execute(f"ALTER TABLE alerts ADD COLUMN {column} {sql_type}")
+
+    def migrate_json(self, json_path):
+        """One-time import of the old db.json. Runs only once per database,
+        even if the table is emptied later by /clear_all."""
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+            if done or not os.path.exists(json_path):
+                return 0
+
+            with open(json_path, "r") as f:
+                try:
+                    data = json.load(f)
+                except ValueError:
+                    data = {}
+
+            rows = [self._to_row(key, entry) for key, entry in data.items()]
+            with self._conn:
+                self._conn.executemany(self._upsert_sql(), rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                    (datetime.now().isoformat(),),
+                )
+            log.info("Migrated %d alerts from %s to %s", len(rows), json_path, self.path)
+            return len(rows)
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _upsert_sql():
+        cols = ", ".join(("key",) + COLUMNS)
+        marks = ", ".join("?" for _ in range(len(COLUMNS) + 1))
+        return f"INSERT OR REPLACE INTO alerts ({cols}) VALUES ({marks})"
+
+    @staticmethod
+    def _to_row(key, entry):
+        return (key,) + tuple(entry.get(c) for c in COLUMNS)
+
+    @staticmethod
+    def _to_entry(row):
+        return {c: row[c] for c in COLUMNS}
+
+    # ---------- reads ----------
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM alerts WHERE key = ?", (key,)
+            ).fetchone()
+        return self._to_entry(row) if row else None
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM alerts WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+
+    def all(self):
+        """Every stored entry as a {key: entry} dict."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM alerts").fetchall()
+        return {r["key"]: self._to_entry(r) for r in rows}
+
+    def by_status(self, *statuses):
+        """Entries with any of the given statuses, oldest first."""
+        marks = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM alerts WHERE status IN ({marks}) ORDER BY time",
+                statuses,
+            ).fetchall()
+        return [self._to_entry(r) for r in rows]
+
+    def iter_alerts(self, since=None, status=None, chunk=1000):
+        """Yield (key, entry) pairs ordered by time, `chunk` rows per query.
+        The lock is only held while a chunk is read, so flushes can run in
+        between."""
+        where = ["(time, key) > (?, ?)"]
+        params = []
+        if since:
+            where.append("time >= ?")
+            params.append(since)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        sql = f"SELECT * FROM alerts WHERE {' AND '.join(where)} ORDER BY time, key LIMIT ?"
+
+        last = ("", "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, (*last, *params, chunk)).fetchall()
+            for r in rows:
+                yield r["key"], self._to_entry(r)
+            if len(rows) < chunk:
+                return
+            last = (rows[-1]["time"], rows[-1]["key"])
+
+    # ---------- writes ----------
+    def put(self, key, entry):
+        with self._lock, self._conn:
+            self._conn.execute(self._upsert_sql(), self._to_row(key, entry))
+
+    def set_status(self, key, status):
+        """Returns False if the key does not exist."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE alerts SET status = ? WHERE key = ?", (status, key)
+            )
+        return cur.rowcount > 0
+
+    @staticmethod
+    def _day_where(day, statuses):
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        marks = ", ".join("?" for _ in statuses)
+        return (
+            f"status IN ({marks}) AND time >= ? AND time < ?",
+            (*statuses, start.isoformat(), end.isoformat()),
+        )
+
+    def count_day(self, day, statuses=("pending", "ignored")):
+        """How many entries delete_day() would delete."""
+        where, params = self._day_where(day, statuses)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM alerts WHERE {where}", params
+            ).fetchone()[0]
+
+    def delete_day(self, day, statuses=("pending", "ignored")):
+        """Delete entries of the given statuses whose time falls on `day`."""
+        where, params = self._day_where(day, statuses)
+        with self._lock, self._conn:
+            cur = self._conn.execute(f"DELETE FROM alerts WHERE {where}", params)
+        return cur.rowcount
+
+    def clear(self):
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM alerts")
+        return cur.rowcount
+
+    def write_batch(self, upserts, deletes=(), clear_first=False, archived=()):
+        """Apply a batch of changes in one transaction. The commit is fsynced,
+        so a crash leaves either the whole batch or none of it on disk.
+        `archived` keys are removed like `deletes` but stay searchable."""
+        with self._lock:
+            self._conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with self._conn:
+                    if clear_first:
+                        self._conn.execute("DELETE FROM alerts")
+                    self._conn.executemany(
+                        "DELETE FROM alerts WHERE key = ?",
+                        [(k,) for k in (*deletes, *archived)],
+                    )
+                    self._conn.executemany(
+                        self._upsert_sql(),
+                        [self._to_row(k, e) for k, e in upserts.items()],
+                    )
+                    if self.search_path:
+                        self._index_batch(upserts, deletes, clear_first, archived)
+            finally:
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    # ---------- search index ----------
+    def _index_entries(self, items, archived=0):
+        """Add (key, entry) pairs to the search index; for keys already
+        indexed only the status is updated. Call inside a transaction."""
+        conn = self._conn
+        for key, e in items:
+            row = conn.execute("SELECT id FROM search.docs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE search.docs SET status = ?, archived = ? WHERE id = ?",
+                    (e.get("status"), archived, row[0]),
+                )
+                continue
+            cur = conn.execute(
+                "INSERT INTO search.docs (key, group_id, group_title, group_username, "
+                "message_id, sender, time, status, archived) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, e.get("group_id"), e.get("group_title"), e.get("group_username"),
+                    e.get("message_id"), e.get("sender"), e.get("time"), e.get("status"),
+                    archived,
+                ),
+            )
+            conn.execute(
+                "INSERT INTO search.fts (rowid, text, sender, group_title) VALUES (?, ?, ?, ?)",
+                (cur.lastrowid, e.get("text") or "", e.get("sender") or "", e.get("group_title") or ""),
+            )
+
+    def _index_batch(self, upserts, deletes, clear_first, archived):
+        conn = self._conn
+        if clear_first:
+            # /clear_all forgets live alerts; archived ones stay searchable
+            conn.execute(
+                "DELETE FROM search.fts WHERE rowid IN (SELECT id FROM search.docs WHERE archived = 0)"
+            )
+            conn.execute("DELETE FROM search.docs WHERE archived = 0")
+        for key in deletes:
+            row = conn.execute("SELECT id FROM search.docs WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM search.fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM search.docs WHERE id = ?", (row[0],))
+        conn.executemany(
+            "UPDATE search.docs SET archived = 1 WHERE key = ?", [(k,) for k in archived]
+        )
+        self._index_entries(upserts.items())
+
+    def _index_live_rows(self):
+        """Index alerts that were stored before the search index existed
+        (runs once per search database)."""
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT value FROM search.meta WHERE key = 'indexed_live'"
+            ).fetchone()
+            if done:
+                return
+            rows = self._conn.execute("SELECT * FROM alerts").fetchall()
+            with self._conn:
+                self._index_entries((r["key"], self._to_entry(r)) for r in rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO search.meta (key, value) VALUES ('indexed_live', ?)",
+                    (datetime.now().isoformat(),),
+                )
+        log.info("Indexed %d stored alerts for search", len(rows))
+
+    def search_flag(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM search.meta WHERE key = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def index_archived(self, items, done_flag=None):
+        """Add archived (key, entry) pairs to the search index. With
+        `done_flag`, also record that a backfill has finished."""
+        with self._lock, self._conn:
+            self._index_entries(items, archived=1)
+            if done_flag:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO search.meta (key, value) VALUES (?, ?)",
+                    (done_flag, datetime.now().isoformat()),
+                )
+
+    def search(self, match, since=None, limit=10, offset=0):
+        """Alerts matching an FTS5 `match` expression, best match first.
+        Returns (total, [entry dicts with a highlighted "text" snippet])."""
+        where = "fts MATCH ?"
+        params = [match]
+        if since:
+            where += " AND d.time >= ?"
+            params.append(since)
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM search.fts JOIN search.docs d ON d.id = fts.rowid WHERE {where}",
+                params,
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT d.*, snippet(fts, 0, '', '', '…', 16) AS snip "
+                f"FROM search.fts JOIN search.docs d ON d.id = fts.rowid WHERE {where} "
+                "ORDER BY rank, d.time DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        results = []
+        for r in rows:
+            # The index keeps only some of the alert columns
+            entry = {c: r[c] for c in r.keys() if c not in ("id", "snip")}
+            entry.update(text=r["snip"], archived=bool(r["archived"]))
+            results.append(entry)
+        return total, results
+
+    def compact(self, vacuum=False):
+        """Checkpoint the WAL so it doesn't keep growing, and optionally
+        VACUUM to give space back after many rows were removed."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if vacuum:
+                self._conn.execute("VACUUM")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ------------------- WRITE-BEHIND CACHE -------------------
+# In-memory authoritative copy of the alert table. Handlers only touch the
+# dicts below; changed keys are remembered and written to SQLite in one
+# transaction from a background task, off the event loop.
+#
+# It also keeps a status index: for every status, a list of (time, key)
+# kept sorted on insert and status change, so summaries can read the k
+# entries they show without scanning the whole table.
+
+
+class AlertCache:
+    """Same interface as AlertStore, but every call is served from memory.
+    Entries returned by get()/by_status() are the cached dicts; change them
+    through put()/set_status() so the change gets flushed."""
+
+    def __init__(self, store, flush_interval=2.0, max_dirty=100, owns=None):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        # Sharded mode: several processes share the DB, each caching only
+        # the keys `owns` accepts (see app/shard.py)
+        self.owns = owns
+
+        self._data = store.all()
+        if owns is not None:
+            self._data = {k: e for k, e in self._data.items() if owns(k)}
+        self._by_status = {}
+        self._members = {}  # lead alert key -> keys coalesced into it
+        for key, entry in self._data.items():
+            self._index_add(key, entry)
+            self._member_add(key, entry)
+
+        self._dirty = set()
+        self._deleted = set()
+        self._archived = set()
+        self._cleared = False
+
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self._closing = False
+
+    # ---------- reads ----------
+    def get(self, key):
+        return self._data.get(key)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def count(self):
+        return len(self._data)
+
+    def by_status(self, *statuses):
+        """Entries with any of the given statuses, oldest first."""
+        lists = [self._by_status.get(s, []) for s in statuses]
+        return [self._data[k] for _, k in heapq.merge(*lists)]
+
+    def count_status(self, status):
+        return len(self._by_status.get(status, ()))
+
+    def status_slice(self, status, start, stop):
+        """Entries `start`..`stop` (oldest first) of one status."""
+        return [self._data[k] for _, k in self._by_status.get(status, [])[start:stop]]
+
+    def burst_members(self, key):
+        """Keys of the alerts that were coalesced into alert `key`."""
+        return list(self._members.get(key, ()))
+
+    def older_than(self, status, time_iso):
+        """(key, entry copy) pairs of one status with time before `time_iso`."""
+        items = self._by_status.get(status, [])
+        stop = bisect.bisect_left(items, (time_iso,))
+        return [(k, dict(self._data[k])) for _, k in items[:stop]]
+
+    # ---------- status index ----------
+    @staticmethod
+    def _index_item(key, entry):
+        return (entry.get("time") or "", key)
+
+    def _index_add(self, key, entry):
+        items = self._by_status.setdefault(entry.get("status"), [])
+        bisect.insort(items, self._index_item(key, entry))
+
+    def _index_remove(self, key, entry):
+        items = self._by_status.get(entry.get("status"))
+        if not items:
+            return
+        item = self._index_item(key, entry)
+        i = bisect.bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    def _member_add(self, key, entry):
+        lead = entry.get("burst")
+        if lead:
+            members = self._members.setdefault(lead, [])
+            if key not in members:
+                members.append(key)
+
+    def _member_remove(self, key, entry):
+        lead = entry.get("burst")
+        members = self._members.get(lead)
+        if members and key in members:
+            members.remove(key)
+            if not members:
+                del self._members[lead]
+
+    # ---------- writes ----------
+    def _mark(self, key):
+        self._dirty.add(key)
+        self._deleted.discard(key)
+        self._archived.discard(key)
+        self._maybe_wakeup()
+
+    def _drop(self, key, archived=False):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._index_remove(key, entry)
+            self._member_remove(key, entry)
+        self._dirty.discard(key)
+        (self._archived if archived else self._deleted).add(key)
+
+    def _maybe_wakeup(self):
+        if self._wakeup is not None and self.pending_writes() >= self.max_dirty:
+            self._wakeup.set()
+
+    def pending_writes(self):
+        return len(self._dirty) + len(self._deleted) + len(self._archived) + int(self._cleared)
+
+    def put(self, key, entry):
+        old = self._data.get(key)
+        if old is not None:
+            self._index_remove(key, old)
+            self._member_remove(key, old)
+        self._data[key] = entry
+        self._index_add(key, entry)
+        self._member_add(key, entry)
+        self._mark(key)
+
+    def set_status(self, key, status):
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if entry.get("status") != status:
+            self._index_remove(key, entry)
+            entry["status"] = status
+            self._index_add(key, entry)
+        self._mark(key)
+        return True
+
+    def delete_day(self, day, statuses=("pending", "ignored")):
+        start = day.isoformat()
+        end = (day + timedelta(days=1)).isoformat()
+        keys = []
+        for status in statuses:
+            items = self._by_status.get(status, [])
+            lo = bisect.bisect_left(items, (start,))
+            hi = bisect.bisect_left(items, (end,))
+            keys.extend(k for _, k in items[lo:hi])
+        for k in keys:
+            self._drop(k)
+        self._maybe_wakeup()
+        return len(keys)
+
+    def delete_keys(self, keys, archived=False):
+        """Remove alerts; `archived` ones stay in the search index."""
+        removed = 0
+        for k in keys:
+            if k in self._data:
+                self._drop(k, archived)
+                removed += 1
+        self._maybe_wakeup()
+        return removed
+
+    def clear(self):
+        count = len(self._data)
+        if self.owns is not None:
+            # Other shards' rows aren't ours to wipe
+            for k in list(self._data):
+                self._drop(k)
+            self._maybe_wakeup()
+            return count
+        self._data.clear()
+        self._by_status.clear()
+        self._members.clear()
+        self._dirty.clear()
+        self._deleted.clear()
+        self._archived.clear()
+        self._cleared = True
+        self._maybe_wakeup()
+        return count
+
+    # ---------- flushing ----------
+    async def flush(self):
+        """Write all pending changes in a single transaction (in a thread)."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self.pending_writes():
+                return 0
+
+            dirty, self._dirty = self._dirty, set()
+            deleted, self._deleted = self._deleted, set()
+            archived, self._archived = self._archived, set()
+            cleared, self._cleared = self._cleared, False
+            upserts = {k: dict(self._data[k]) for k in dirty if k in self._data}
+
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(
+                    self.store.write_batch, upserts, deleted, cleared, archived
+                )
+            except Exception as e:
+                # Keep the changes so the next flush retries them
+                log.error("DB flush failed, will retry: %r", e)
+                self._dirty |= dirty - self._deleted - self._archived
+                self._deleted |= deleted - self._dirty
+                self._archived |= archived - self._dirty
+                self._cleared = self._cleared or cleared
+                raise
+            finally:
+                DB_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            rows = len(upserts) + len(deleted) + len(archived)
+            DB_FLUSH_ROWS.inc(rows)
+            return rows
+
+    async def run(self):
+        """Background loop: flush every `flush_interval` seconds, or right
+        away once `max_dirty` changes have piled up."""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def close(self):
+        # Stop the loop through a flag rather than cancel(), so a flush that
+        # is already running is allowed to finish
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,157 @@
+from datetime import datetime
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# ------------------- SUMMARY RENDERING -------------------
+# Shared by /summary and the daily summary. Pages are cut by item count and
+# read straight from the store's status index, so building one page only
+# touches the entries shown on it.
+
+PAGE_SIZE = 10  # items per page; keeps each page well under 4096 chars
+
+SECTIONS = (
+    ("pending", "⏳ Pending"),
+    ("ignored", "🚫 Ignored"),
+)
+
+
+def message_link(group_id, group_username, message_id):
+    """Link to the original group message, or None for basic groups."""
+    if group_username:
+        return f"tg://resolve?domain={group_username}&post={message_id}"
+    if str(group_id).startswith("-100"):
+        return f"https://t.me/c/{str(group_id)[4:]}/{message_id}"
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _render_line(time_iso, group_title, sender, text, group_username, group_id, message_id):
+    try:
+        time_str = datetime.fromisoformat(time_iso).strftime("%Y-%m-%d %H:%M")
+    except Exception:
+        time_str = time_iso or "Unknown time"
+
+    preview = (text or "").replace("\n", " ")[:80]
+    line = (
+        f"- `[{time_str}]` *{group_title}* — *{sender}*\n"
+        f"  {preview}...\n"
+    )
+
+    open_link = message_link(group_id, group_username, message_id)
+    if open_link:
+        line += f"  [Open message]({open_link})\n\n"
+    else:
+        line += f"  Message ID: `{message_id}`\n\n"
+    return line
+
+
+def render_entry(entry):
+    """One summary line for an alert. Cached, since the same pending items
+    show up in every summary until they are handled."""
+    return _render_line(
+        entry.get("time"),
+        entry.get("group_title", "group"),
+        entry.get("sender", "Unknown"),
+        entry.get("text"),
+        entry.get("group_username"),
+        entry.get("group_id"),
+        entry.get("message_id"),
+    )
+
+
+class SummaryView:
+    """The part of the count_status/status_slice interface render_page()
+    needs, over plain per-status lists (e.g. one destination's alerts)."""
+
+    def __init__(self, by_status):
+        self.by_status = by_status
+
+    def count_status(self, status):
+        return len(self.by_status.get(status, ()))
+
+    def status_slice(self, status, start, stop):
+        return self.by_status.get(status, [])[start:stop]
+
+
+def split_by_destination(store, default_dest):
+    """One pass over the pending/ignored index: {(dest, thread_id):
+    SummaryView}. Alerts stored before destinations were recorded count as
+    `default_dest`."""
+    groups = {}
+    for status, _ in SECTIONS:
+        for entry in store.by_status(status):
+            dest = (entry.get("dest") or default_dest, entry.get("thread_id"))
+            by_status = groups.setdefault(dest, {})
+            by_status.setdefault(status, []).append(entry)
+    return {dest: SummaryView(by_status) for dest, by_status in groups.items()}
+
+
+def page_count(store, page_size=PAGE_SIZE):
+    total = sum(store.count_status(status) for status, _ in SECTIONS)
+    return max(1, -(-total // page_size))
+
+
+def render_page(store, title, page=0, page_size=PAGE_SIZE):
+    """Text of one summary page. Returns (text, page, pages); `page` is
+    clamped to the valid range."""
+    pages = page_count(store, page_size)
+    page = min(max(page, 0), pages - 1)
+    start = page * page_size
+    stop = start + page_size
+
+    header = f"📊 *{title}*"
+    if pages > 1:
+        header += f" ({page + 1}/{pages})"
+    text = header + "\n\n"
+
+    offset = 0  # position of this section in the combined list
+    for status, section_title in SECTIONS:
+        count = store.count_status(status)
+        lo = max(start - offset, 0)
+        hi = min(stop - offset, count)
+
+        if lo < hi:
+            text += f"*{section_title}*\n"
+            for entry in store.status_slice(status, lo, hi):
+                text += render_entry(entry)
+        elif count == 0:
+            # Empty section: show it on the page where it would have started
+            if start <= offset < stop or (page == pages - 1 and offset >= start):
+                text += f"*{section_title}*\n_No messages._\n\n"
+
+        offset += count
+
+    return text, page, pages
+
+
+def page_keyboard(page, pages, action="summary"):
+    """Prev/next buttons for /summary (or /search), or None for a single page."""
+    if pages <= 1:
+        return None
+
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀ Prev", callback_data=f"{action}|{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("Next ▶", callback_data=f"{action}|{page + 1}"))
+    return InlineKeyboardMarkup([row])
+
+
+STATUS_ICONS = {"pending": "⏳", "ignored": "🚫", "replied": "✅"}
+
+
+def render_search_page(query, results, total, page, pages):
+    """Text of one /search result page (results come from store.search)."""
+    header = f"🔎 *{query}* — {total} result{'s' if total != 1 else ''}"
+    if pages > 1:
+        header += f" ({page + 1}/{pages})"
+    text = header + "\n\n"
+    if not results:
+        return text + "_No messages._"
+    for entry in results:
+        icon = STATUS_ICONS.get(entry.get("status"), "")
+        if entry.get("archived"):
+            icon += "🗄"
+        text += f"{icon} " + render_entry(entry)
+    return text
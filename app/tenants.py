@@ -0,0 +1,287 @@
+"""
+Multi-tenant mode: one process, one event loop, a bot for every tenant.
+
+    python -m app.tenants
+
+TENANTS_FILE maps each tenant's name to the settings that differ from the
+environment (the same names as in app/config.py / .env):
+
+    {
+      "acme":   {"BOT_TOKEN": "123:abc", "BOSS_ID": 111, "GROUP_ID": -1001},
+      "globex": {"BOT_TOKEN": "456:def", "BOSS_ID": 222}
+    }
+
+Every tenant is a full bot (app/bot.py) with its own Application, alert
+cache, send queue and state. Its data files live under TENANT_DIR/<name>/
+(alerts.db, search.db, outbox.db, state.json, archive/, routing.json), so
+tenants never see each other's alerts. What is shared:
+  - the module code: app.config and app.bot are compiled once and run once
+    per tenant, and identical trigger lists share one compiled matcher
+    (see app/routing.py)
+  - the HTTP connection pools (app/http.py), one set for all tokens
+  - one job scheduler with one timer, instead of a scheduler per bot
+  - the metrics server; gauges are summed over tenants
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import re
+import signal
+import sys
+import types
+import weakref
+
+import pytz
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from telegram.ext import Job, JobQueue
+
+# Imported before any tenant config exists, so they (and app.http, which
+# app.shard imports) keep the process-wide one
+import app.shard  # noqa: F401
+from app import metrics
+from app.config import (
+    LOG_DEBUG_SAMPLE,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    METRICS_HOST,
+    METRICS_PORT,
+    TENANT_DIR,
+    TENANTS_FILE,
+)
+from app.http import SharedRequest, build_requests_from_config
+from app.log import setup_logging
+
+log = logging.getLogger(__name__)
+
+TENANT_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+# ------------------- TENANT CONFIG -------------------
+def read_tenants(path):
+    """{name: settings} from TENANTS_FILE. Raises ValueError on a bad file."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{path}: expected an object of tenants")
+    for name, settings in data.items():
+        if not TENANT_NAME.match(name):
+            raise ValueError(f"{path}: bad tenant name {name!r} (letters, digits, _ and -)")
+        if not isinstance(settings, dict) or not settings.get("BOT_TOKEN"):
+            raise ValueError(f"{path}: tenant {name!r} needs a BOT_TOKEN")
+    return data
+
+
+def tenant_env(name, settings):
+    """Environment a tenant's app.config is read with: its own data files,
+    no metrics port or sharding of its own, then its settings on top."""
+    base = os.path.join(TENANT_DIR, name)
+    env = {
+        "DB_FILE": os.path.join(base, "alerts.db"),
+        "LEGACY_DB_FILE": os.path.join(base, "db.json"),
+        "SEARCH_DB_FILE": os.path.join(base, "search.db"),
+        "OUTBOX_FILE": os.path.join(base, "outbox.db"),
+        "STATE_FILE": os.path.join(base, "state.json"),
+        "ARCHIVE_DIR": os.path.join(base, "archive"),
+        "ROUTING_FILE": os.path.join(base, "routing.json"),
+        "METRICS_PORT": "0",
+        "SHARDS": "1",
+        "SHARD_INDEX": "",
+    }
+    env.update({k: "" if v is None else str(v) for k, v in settings.items()})
+    return env
+
+
+# ------------------- TENANT MODULES -------------------
+# module name -> (spec, code object), read from disk once for all tenants
+_code = {}
+
+
+def _exec_module(name, alias):
+    """Run module `name` again as a new module called `alias`."""
+    if name not in _code:
+        spec = importlib.util.find_spec(name)
+        _code[name] = (spec, spec.loader.get_code(name))
+    spec, code = _code[name]
+    module = types.ModuleType(alias)
+    module.__file__ = spec.origin
+    module.__package__ = spec.parent
+    exec(code, module.__dict__)
+    return module
+
+
+class Tenant:
+    __slots__ = ("name", "config", "bot", "app", "started")
+
+    def __init__(self, name, config, bot):
+        self.name = name
+        self.config = config
+        self.bot = bot
+        self.app = None
+        self.started = False
+
+
+def load_tenant(name, settings):
+    """Fresh app.config and app.bot modules for one tenant. While they run,
+    the environment holds the tenant's settings and "app.config" in
+    sys.modules is the tenant's, so app.bot imports its values from there."""
+    env = tenant_env(name, settings)
+    os.makedirs(os.path.join(TENANT_DIR, name), exist_ok=True)
+    saved_env = dict(os.environ)
+    saved_config = sys.modules["app.config"]
+    try:
+        os.environ.update(env)
+        config = _exec_module("app.config", f"app.config@{name}")
+        sys.modules["app.config"] = config
+        bot = _exec_module("app.bot", f"app.bot@{name}")
+    finally:
+        sys.modules["app.config"] = saved_config
+        os.environ.clear()
+        os.environ.update(saved_env)
+    return Tenant(name, config, bot)
+
+
+# ------------------- SHARED JOB SCHEDULER -------------------
+class SharedJobQueue(JobQueue):
+    """A tenant's JobQueue on the scheduler all tenants share. Jobs still run
+    with the tenant's application; stopping the queue removes only its own
+    jobs, the scheduler keeps running for the others."""
+
+    __slots__ = ()
+
+    def __init__(self, scheduler, executor):
+        # JobQueue.__init__ would create a scheduler of its own
+        self._application = None
+        self._executor = executor
+        self.scheduler = scheduler
+
+    def set_application(self, application):
+        # configure() can't be called on a running scheduler, and the shared
+        # one is already set up
+        self._application = weakref.ref(application)
+
+    def jobs(self):
+        return tuple(
+            Job.from_aps_job(job) for job in self.scheduler.get_jobs() if job.args[0] is self
+        )
+
+    async def stop(self, wait=True):
+        for job in self.jobs():
+            job.schedule_removal()
+        if wait:
+            await asyncio.gather(*self._executor._pending_futures, return_exceptions=True)
+
+
+def shared_scheduler():
+    executor = AsyncIOExecutor()
+    scheduler = AsyncIOScheduler(timezone=pytz.utc, executors={"default": executor})
+    return scheduler, executor
+
+
+# ------------------- RUNNING -------------------
+async def start_tenant(tenant):
+    """What run_polling() / run_webhook() would do for one tenant's app."""
+    application, config = tenant.app, tenant.config
+    await application.initialize()
+    await tenant.bot.post_init(application)
+    tenant.started = True
+    await application.start()
+    if config.BOT_MODE == "webhook":
+        # Each tenant needs a WEBHOOK_PORT of its own
+        await application.updater.start_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=config.WEBHOOK_URL,
+            secret_token=config.WEBHOOK_SECRET,
+        )
+    else:
+        await application.updater.start_polling()
+    log.info("✅ Tenant %s running (%s)", tenant.name, config.BOT_MODE)
+
+
+async def stop_tenant(tenant):
+    application = tenant.app
+    if application.updater.running:
+        await application.updater.stop()
+    if application.running:
+        await application.stop()
+    else:
+        # Jobs were added to the shared scheduler when the app was built
+        await application.job_queue.stop(wait=False)
+    if tenant.started:
+        await tenant.bot.post_shutdown(application)
+    await application.shutdown()
+
+
+async def run(tenants):
+    request, get_updates_request = build_requests_from_config(
+        updates_pool_size=2 * len(tenants)
+    )
+    request, get_updates_request = SharedRequest(request), SharedRequest(get_updates_request)
+    scheduler, executor = shared_scheduler()
+    for tenant in tenants:
+        tenant.app = tenant.bot.build_app(
+            request, get_updates_request, SharedJobQueue(scheduler, executor)
+        )
+
+    server = None
+    running = []
+    try:
+        if METRICS_PORT:
+            server = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        for tenant in tenants:
+            # One tenant with a bad token must not take the others down
+            try:
+                await start_tenant(tenant)
+            except Exception:
+                log.exception("Tenant %s failed to start", tenant.name)
+                await stop_tenant(tenant)
+            else:
+                running.append(tenant)
+        if not running:
+            log.error("No tenant could be started")
+            return 1
+        log.info("✅ %d of %d tenants running", len(running), len(tenants))
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        log.info("Stopping %d tenants...", len(running))
+    finally:
+        # All at once: stopping an updater waits for its current long poll
+        results = await asyncio.gather(
+            *(stop_tenant(t) for t in running), return_exceptions=True
+        )
+        for tenant, result in zip(running, results):
+            if isinstance(result, Exception):
+                log.error("Tenant %s did not stop cleanly", tenant.name, exc_info=result)
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        # A tenant that failed in Bot.initialize() never gave its share back
+        await request.request.shutdown()
+        await get_updates_request.request.shutdown()
+        if server is not None:
+            server.close()
+    return 0
+
+
+def main():
+    setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE)
+    try:
+        config = read_tenants(TENANTS_FILE)
+    except (OSError, ValueError) as e:
+        log.error("Can't read tenants: %s", e)
+        return 1
+    tenants = [load_tenant(name, settings) for name, settings in config.items()]
+    log.info("Loaded %d tenants from %s", len(tenants), TENANTS_FILE)
+    return asyncio.run(run(tenants))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
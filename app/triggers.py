@@ -0,0 +1,129 @@
+import re
+from typing import NamedTuple, Optional
+
+# ------------------- TRIGGER MATCHER -------------------
+# All trigger words (ROUTES keys, TRIGGERS_TO_BOSS, TRIGGERS_TO_GROUP) are
+# compiled once into a single trie-shaped regex. One scan over the message
+# finds every trigger, and the cost per character depends on the length of
+# the trigger words, not on how many of them there are.
+
+# Lower number = higher priority. Routes keep their dict order among themselves.
+PRIORITY_ROUTE = 0
+PRIORITY_BOSS = 1000
+PRIORITY_GROUP = 2000
+
+
+class Trigger(NamedTuple):
+    word: str
+    kind: str  # "route", "boss" or "group"
+    priority: int
+    route: Optional[dict] = None
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class TriggerMatcher:
+    def __init__(
+        self,
+        routes=None,
+        to_boss=(),
+        to_group=(),
+        word_boundary=False,
+        casefold=False,
+    ):
+        self.word_boundary = word_boundary
+        self.casefold = casefold
+
+        # normalized word -> triggers using it (the same word can be a route
+        # key and a boss trigger at the same time)
+        self._triggers = {}
+        for i, (word, info) in enumerate((routes or {}).items()):
+            self._add(Trigger(word, "route", PRIORITY_ROUTE + i, info))
+        for word in to_boss:
+            self._add(Trigger(word, "boss", PRIORITY_BOSS))
+        for word in to_group:
+            self._add(Trigger(word, "group", PRIORITY_GROUP))
+
+        # The regex reports the longest trigger starting at each position.
+        # Shorter triggers that are a prefix of it are looked up here.
+        words = sorted(self._triggers)
+        self._prefixes = {
+            w: [p for p in words if p != w and w.startswith(p)] for w in words
+        }
+        self._pattern = self._compile(words)
+
+    def _norm(self, text):
+        return text.casefold() if self.casefold else text.lower()
+
+    def _add(self, trigger):
+        word = self._norm(trigger.word)
+        if not word:
+            return
+        self._triggers.setdefault(word, []).append(trigger)
+
+    # ---------- compile ----------
+    def _compile(self, words):
+        if not words:
+            return None
+
+        trie = {}
+        for w in words:
+            node = trie
+            for ch in w:
+                node = node.setdefault(ch, {})
+            node[""] = w  # terminal marker
+
+        def end_check(word):
+            if self.word_boundary and _is_word_char(word[-1]):
+                return r"(?!\w)"
+            return ""
+
+        def build(node):
+            branches = [
+                re.escape(ch) + build(child)
+                for ch, child in node.items()
+                if ch != ""
+            ]
+            # Terminal last so that longer triggers are tried first
+            if "" in node:
+                branches.append(end_check(node[""]))
+            if len(branches) == 1:
+                return branches[0]
+            return "(?:" + "|".join(branches) + ")"
+
+        roots = []
+        for ch, child in trie.items():
+            start = r"(?<!\w)" if self.word_boundary and _is_word_char(ch) else ""
+            roots.append(start + re.escape(ch) + build(child))
+
+        return re.compile("(?=(" + "|".join(roots) + "))")
+
+    # ---------- match ----------
+    def _ends_cleanly(self, text, end, word):
+        if not self.word_boundary or not _is_word_char(word[-1]):
+            return True
+        return end >= len(text) or not _is_word_char(text[end])
+
+    def match(self, text):
+        """All triggers found in `text`, sorted by priority."""
+        if self._pattern is None or not text:
+            return []
+
+        text = self._norm(text)
+        found = set()
+        for m in self._pattern.finditer(text):
+            word = m.group(1)
+            found.add(word)
+            pos = m.start()
+            for p in self._prefixes[word]:
+                if p not in found and self._ends_cleanly(text, pos + len(p), p):
+                    found.add(p)
+
+        hits = [t for w in found for t in self._triggers[w]]
+        hits.sort(key=lambda t: t.priority)
+        return hits
+
+    def __len__(self):
+        return len(self._triggers)
@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+# ------------------- TTL MAP -------------------
+# Small dict with a per-entry deadline, used for reply_map and the
+# per-sender media follow-up windows (app/follow.py). Deadlines sit in a
+# heap, so expire() only looks at entries that are actually due, and
+# max_size evicts the soonest-to-expire entries first. Deadlines are
+# wall-clock timestamps so a snapshot can be restored after a restart.
+
+
+class TTLMap:
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}  # key -> (value, deadline)
+        self._heap = []  # (deadline, seq, key); stale items skipped lazily
+        self._seq = itertools.count()
+        self.dirty = False  # changed since the last snapshot
+
+    # ---------- dict-like ----------
+    def set(self, key, value, ttl=None, now=None):
+        now = time.time() if now is None else now
+        deadline = now + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, deadline)
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        self.dirty = True
+        self._evict_over_size()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        if item[1] <= time.time():
+            self._remove(key)
+            return default
+        return item[0]
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self._remove(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        marker = object()
+        value = self.get(key, marker)
+        if value is marker:
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key):
+        if key not in self._data:
+            raise KeyError(key)
+        self._remove(key)
+
+    def __contains__(self, key):
+        marker = object()
+        return self.get(key, marker) is not marker
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self._heap.clear()
+        self.dirty = True
+
+    # ---------- expiry ----------
+    def _remove(self, key):
+        if self._data.pop(key, None) is not None:
+            self.dirty = True
+
+    def _pop_heap(self):
+        """Pop the next live heap item, skipping ones that were overwritten
+        or deleted. Returns (deadline, key) or None."""
+        while self._heap:
+            deadline, _, key = heapq.heappop(self._heap)
+            item = self._data.get(key)
+            if item is not None and item[1] == deadline:
+                return deadline, key
+        return None
+
+    def expire(self, now=None):
+        """Drop every entry past its deadline. Returns how many were dropped."""
+        now = time.time() if now is None else now
+        dropped = 0
+        while self._heap and self._heap[0][0] <= now:
+            popped = self._pop_heap()
+            if popped is None:
+                break
+            deadline, key = popped
+            if deadline > now:
+                # Live but not due yet: put it back and stop
+                heapq.heappush(self._heap, (deadline, next(self._seq), key))
+                break
+            self._remove(key)
+            dropped += 1
+
+        # Overwrites leave stale heap items behind; rebuild once they dominate
+        if len(self._heap) > 2 * len(self._data) + 64:
+            self._heap = [(d, next(self._seq), k) for k, (_, d) in self._data.items()]
+            heapq.heapify(self._heap)
+        return dropped
+
+    def _evict_over_size(self):
+        while len(self._data) > self.max_size:
+            popped = self._pop_heap()
+            if popped is None:
+                break
+            self._remove(popped[1])
+
+    # ---------- snapshots ----------
+    def snapshot(self):
+        """[key, value, deadline] triples of the live entries (JSON-friendly)."""
+        now = time.time()
+        return [[k, v, d] for k, (v, d) in self._data.items() if d > now]
+
+    def restore(self, items):
+        now = time.time()
+        for key, value, deadline in items:
+            if deadline > now:
+                self._data[key] = (value, deadline)
+                heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        self._evict_over_size()
+        self.dirty = False
+
+
+def snapshot_maps(maps):
+    """{name: TTLMap} -> JSON-friendly dict. Clears the maps' dirty flags, so
+    call it on the event loop and hand the result to write_snapshot()."""
+    data = {name: m.snapshot() for name, m in maps.items()}
+    for m in maps.values():
+        m.dirty = False
+    return data
+
+
+def write_snapshot(path, data):
+    """Write a snapshot atomically (temp file, fsync, rename)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_snapshot(path, maps):
+    """Fill {name: TTLMap} from `path`; expired entries are skipped."""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except ValueError:
+        log.warning("Ignoring unreadable state snapshot %s", path)
+        return
+    for name, m in maps.items():
+        m.restore(data.get(name, []))
@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+
+# app.bot opens its files at import, from the settings in app.config, so
+# they are pointed at a temp directory before anything imports them
+DATA_DIR = tempfile.mkdtemp(prefix="bot-tests-")
+BOSS_ID = 1000
+GROUP_ID = 2000
+
+os.environ.update(
+    BOT_TOKEN="123456:test",
+    BOSS_ID=str(BOSS_ID),
+    GROUP_ID=str(GROUP_ID),
+    DB_FILE=os.path.join(DATA_DIR, "alerts.db"),
+    LEGACY_DB_FILE="",
+    SEARCH_DB_FILE=os.path.join(DATA_DIR, "search.db"),
+    OUTBOX_FILE=os.path.join(DATA_DIR, "outbox.db"),
+    STATE_FILE=os.path.join(DATA_DIR, "state.json"),
+    ARCHIVE_DIR=os.path.join(DATA_DIR, "archive"),
+    ROUTING_FILE=os.path.join(DATA_DIR, "routing.json"),
+    METRICS_PORT="0",
+    LOG_LEVEL="WARNING",
+)
+os.environ.pop("TELEGRAM_BASE_URL", None)
+os.environ.pop("SHARD_INDEX", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio  # noqa: E402
+import time  # noqa: E402
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def loop():
+    """One event loop for every test that uses app.bot, whose module-level
+    queues and locks belong to the loop they were first used on."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def bot_app(loop):
+    """(app.bot module, Application, stub request), started the way
+    run_polling() would start it. The stub answers every Bot API call locally."""
+    from app import bot
+    from app.bench import StubRequest
+
+    request = StubRequest()
+    app = bot.build_app(request=request)
+    loop.run_until_complete(app.initialize())
+    loop.run_until_complete(bot.post_init(app))
+    yield bot, app, request
+    loop.run_until_complete(bot.post_shutdown(app))
+    loop.run_until_complete(app.shutdown())
+
+
+async def settle(bot):
+    """Wait until the send queue is empty and deliveries are recorded."""
+    while bot.sender.depth():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+
+
+def group_update(update_id, chat_id, message_id, text, user_id=5):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"g{chat_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    }
@@ -0,0 +1,33 @@
+import importlib.util
+
+import pytest
+
+from app.config import MEDIA_TYPES
+from app.follow import MEDIA_FILTERS
+
+
+def load_config(monkeypatch, **env):
+    """A fresh copy of app.config read with `env` set."""
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    spec = importlib.util.find_spec("app.config")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_media_types_match_filters():
+    assert set(MEDIA_TYPES) == set(MEDIA_FILTERS)
+
+
+def test_follow_media(monkeypatch):
+    config = load_config(monkeypatch, FOLLOW_MEDIA=" voice, photo ,,animation")
+    assert config.FOLLOW_MEDIA == ["voice", "photo", "animation"]
+
+
+def test_unknown_follow_media(monkeypatch):
+    with pytest.raises(ValueError) as e:
+        load_config(monkeypatch, FOLLOW_MEDIA="voice,voice_note,sticker")
+    assert "voice_note, sticker" in str(e.value)
+    for name in MEDIA_TYPES:
+        assert name in str(e.value)
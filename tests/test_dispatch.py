@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.dispatch import ChatOrderedProcessor
+
+
+def chat_update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id))
+
+
+def test_chat_updates_run_in_order():
+    done = []
+
+    async def handle(n):
+        await asyncio.sleep(0.01 * (5 - n))
+        done.append(n)
+
+    async def run():
+        processor = ChatOrderedProcessor(4)
+        await asyncio.gather(*(
+            processor.process_update(chat_update(1), handle(n)) for n in range(5)
+        ))
+
+    asyncio.run(run())
+    assert done == [0, 1, 2, 3, 4]
+
+
+def test_busy_chat_does_not_hold_slots():
+    started = []
+    release = None
+
+    async def handle(chat_id):
+        started.append(chat_id)
+        await release.wait()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        processor = ChatOrderedProcessor(2)
+        busy = [
+            asyncio.create_task(processor.process_update(chat_update(1), handle(1)))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        other = asyncio.create_task(processor.process_update(chat_update(2), handle(2)))
+        await asyncio.sleep(0.01)
+        # Chat 1's four waiting updates don't keep chat 2 out
+        assert started == [1, 2]
+        release.set()
+        await asyncio.gather(*busy, other)
+
+    asyncio.run(run())
+    assert started == [1, 2, 1, 1, 1, 1]
+
+
+def test_limit_still_applies_across_chats():
+    running = peak = 0
+
+    async def handle():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run():
+        processor = ChatOrderedProcessor(3)
+        await asyncio.gather(*(
+            processor.process_update(chat_update(n), handle()) for n in range(10)
+        ))
+
+    asyncio.run(run())
+    assert peak == 3
@@ -0,0 +1,41 @@
+import gzip
+import io
+import json
+import time
+
+from telegram import Update
+
+from app.export import write_export
+from conftest import BOSS_ID
+
+
+def command_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": BOSS_ID, "type": "private"},
+            "from": {"id": BOSS_ID, "is_bot": False, "first_name": "boss"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def test_write_export_jsonl():
+    records = [{"key": "-1_1", "text": "plan", "archived": False}, {"key": "-1_2", "text": "é"}]
+    buf = io.BytesIO()
+    assert write_export(iter(records), buf, "jsonl") == 2
+    lines = gzip.decompress(buf.getvalue()).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == records
+
+
+def test_export_over_limit_is_refused(bot_app, loop, monkeypatch):
+    bot, app, request = bot_app
+    monkeypatch.setattr(bot, "EXPORT_MAX_MB", 0)
+    sent = request.calls.get("sendMessage", 0)
+    update = Update.de_json(command_update(900, "/export"), app.bot)
+    loop.run_until_complete(app.process_update(update))
+    assert request.calls.get("sendMessage", 0) == sent + 1
+    assert "sendDocument" not in request.calls
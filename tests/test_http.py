@@ -0,0 +1,21 @@
+from app import config
+from app.http import build_requests_from_config
+
+
+def test_requests_from_config():
+    request, updates = build_requests_from_config()
+    assert request.default.pool_size == config.HTTP_POOL_SIZE
+    assert request.routes["forwardMessage"].pool_size == config.HTTP_MEDIA_POOL_SIZE
+    assert request.read_timeout == config.HTTP_READ_TIMEOUT
+    assert updates.pool == "updates" and updates.pool_size == 2
+
+
+def test_requests_from_config_overrides():
+    request, updates = build_requests_from_config(
+        pool_size=4, media_pool_size=1, updates_pool_size=6
+    )
+    assert request.default.pool_size == 4
+    assert request.routes["sendVoice"].pool_size == 1
+    assert updates.pool_size == 6
+    # Settings that weren't overridden still come from the config
+    assert request.routes["sendVoice"].pool_timeout == config.HTTP_POOL_TIMEOUT
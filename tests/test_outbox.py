@@ -0,0 +1,165 @@
+import asyncio
+import sqlite3
+import time
+
+from telegram import Update
+from telegram.error import TimedOut
+
+from app.outbox import Outbox, alert_payload
+from conftest import BOSS_ID, group_update, settle
+
+
+def test_second_claim_is_ignored(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    try:
+        assert outbox.claim("alert:1_1", "alert", 10, alert_payload(10, "a"))
+        assert not outbox.claim("alert:1_1", "alert", 10, alert_payload(10, "b"))
+        assert [p["text"] for _, _, _, p in outbox.pending()] == ["a"]
+    finally:
+        outbox.close()
+
+
+def test_pending_survives_reopen(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path)
+    outbox.claim("alert:1_1", "alert", 10, alert_payload(10, "sent"))
+    outbox.claim("alert:1_2", "alert", 10, alert_payload(10, "unsent"))
+    outbox.done("alert:1_1", message_id=99)
+    outbox.close()
+
+    outbox = Outbox(path)
+    try:
+        assert outbox.pending() == [("alert:1_2", "alert", 10, alert_payload(10, "unsent"))]
+        # Already claimed before the restart, so still deduplicated
+        assert not outbox.claim("alert:1_1", "alert", 10, alert_payload(10, "sent"))
+    finally:
+        outbox.close()
+
+
+def test_prune_keeps_pending_rows(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    try:
+        outbox.claim("alert:1_1", "alert", 10, alert_payload(10, "a"))
+        outbox.claim("alert:1_2", "alert", 10, alert_payload(10, "b"))
+        outbox.done("alert:1_1")
+        assert outbox.prune(-1) == 1
+        assert [k for k, _, _, _ in outbox.pending()] == ["alert:1_2"]
+    finally:
+        outbox.close()
+
+
+def test_replay_sends_each_row_once(bot_app, loop):
+    bot, app, request = bot_app
+    for i in range(3):
+        bot.outbox.claim(f"alert:-300_{i}", "alert", 3000 + i, alert_payload(3000 + i, "x"))
+
+    async def run():
+        before = request.calls.get("sendMessage", 0)
+        await bot.replay_outbox(app.bot)
+        await settle(bot)
+        # Delivered rows are no longer pending, so a second replay sends nothing
+        await bot.replay_outbox(app.bot)
+        await settle(bot)
+        return request.calls.get("sendMessage", 0) - before
+
+    assert loop.run_until_complete(run()) == 3
+    assert not [k for k, _, _, _ in bot.outbox.pending() if k.startswith("alert:-300_")]
+
+
+def test_failed_claim_does_not_drop_alert(bot_app, loop, monkeypatch):
+    bot, app, request = bot_app
+    claim = bot.outbox.claim
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def run():
+        before = request.calls.get("sendMessage", 0)
+        monkeypatch.setattr(bot.outbox, "claim", locked)
+        await app.process_update(Update.de_json(group_update(1, -401, 1, "production"), app.bot))
+        assert "-401_1" not in bot.store
+        # Neither is a later trigger merged into a burst that will never send
+        await app.process_update(Update.de_json(group_update(2, -401, 2, "production"), app.bot))
+        assert "-401_2" not in bot.store
+
+        monkeypatch.setattr(bot.outbox, "claim", claim)
+        # Telegram delivers the first update again
+        await app.process_update(Update.de_json(group_update(1, -401, 1, "production"), app.bot))
+        await settle(bot)
+        return request.calls.get("sendMessage", 0) - before
+
+    assert loop.run_until_complete(run()) == 1
+    assert bot.store.get("-401_1")["dest"] == BOSS_ID
+    assert not [k for k, _, _, _ in bot.outbox.pending() if k == "alert:-401_1"]
+
+
+def test_redelivered_alert_is_sent_once(bot_app, loop):
+    bot, app, request = bot_app
+
+    async def run():
+        before = request.calls.get("sendMessage", 0)
+        update = group_update(3, -402, 1, "production")
+        await app.process_update(Update.de_json(update, app.bot))
+        await settle(bot)
+        await app.process_update(Update.de_json(update, app.bot))
+        await settle(bot)
+        return request.calls.get("sendMessage", 0) - before
+
+    assert loop.run_until_complete(run()) == 1
+
+
+def test_concurrent_burst_sends_one_alert(bot_app, loop):
+    bot, app, request = bot_app
+
+    async def run():
+        before = request.calls.get("sendMessage", 0)
+        await asyncio.gather(*(
+            app.process_update(Update.de_json(group_update(10 + i, -403, i, "production"), app.bot))
+            for i in range(5)
+        ))
+        await settle(bot)
+        return request.calls.get("sendMessage", 0) - before
+
+    assert loop.run_until_complete(run()) == 1
+    assert sorted(bot.store.burst_members("-403_0")) == ["-403_1", "-403_2", "-403_3", "-403_4"]
+
+
+def private_update(update_id, user_id, message_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "boss"},
+            "text": text,
+        },
+    }
+
+
+def test_forward_retried_after_timeout(bot_app, loop, monkeypatch):
+    bot, app, request = bot_app
+    perform = bot.perform
+    attempts = []
+
+    async def flaky(tg, kind, payload):
+        if kind == "forward":
+            attempts.append(payload["message_id"])
+            if len(attempts) == 1:
+                raise TimedOut()
+        return await perform(tg, kind, payload)
+
+    async def run():
+        await app.process_update(Update.de_json(group_update(20, -404, 1, "production"), app.bot))
+        await settle(bot)
+        monkeypatch.setattr(bot, "perform", flaky)
+        bot.reply_map[BOSS_ID] = "-404_1"
+        await app.process_update(Update.de_json(private_update(21, BOSS_ID, 50, "on it"), app.bot))
+        await settle(bot)
+
+    loop.run_until_complete(run())
+    # Reply mode is over, and the queued retry went through once
+    assert BOSS_ID not in bot.reply_map
+    assert attempts == [50, 50]
+    assert bot.store.get("-404_1")["status"] == "replied"
+    assert not [k for k, _, _, _ in bot.outbox.pending() if k == f"forward:{BOSS_ID}:50"]
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from app.routing import build_routing, load_routing, parse_routing_config
+
+DEFAULTS = {
+    "routes": {},
+    "to_boss": ["plan"],
+    "to_group": ["yang"],
+    "boss_usernames": [],
+    "chats": {},
+}
+
+
+def write(path, data, mtime):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+    # Distinct mtimes even when the tests write faster than the clock ticks
+    os.utime(path, ns=(mtime, mtime))
+
+
+def triggers(table, chat_id, text):
+    return [t.word for t in table.rules_for(chat_id).matcher.match(text)]
+
+
+def test_file_overrides_defaults(tmp_path):
+    path = str(tmp_path / "routing.json")
+    data = {
+        "to_boss": ["deploy"],
+        "chats": {"-100222": {"to_boss": ["db"], "quiet_hours": [22, 7]}},
+    }
+    write(path, data, 1)
+    table, mtime = load_routing(path, DEFAULTS, boss_chat=1, group_chat=2)
+    assert mtime == 1
+    assert triggers(table, -100999, "plan to deploy") == ["deploy"]
+    assert triggers(table, -100222, "deploy the db") == ["db"]
+    assert table.rules_for(-100222).quiet_hours == (22, 7)
+
+
+def test_no_file_uses_defaults(tmp_path):
+    table, mtime = load_routing(str(tmp_path / "missing.json"), DEFAULTS, 1, 2)
+    assert mtime is None
+    assert triggers(table, -1, "the plan") == ["plan"]
+
+
+@pytest.mark.parametrize("data, error", [
+    ({"to_boss": "plan"}, "to_boss must be a list of strings"),
+    ({"triggers": []}, "unknown keys"),
+    ({"routes": {"x": {"thread_id": 7}}}, "routes.x.boss_chat must be an integer"),
+    ({"chats": {"abc": {}}}, "is not a chat id"),
+    ({"chats": {"-1": {"quiet_hours": [22]}}}, "quiet_hours"),
+    ([], "JSON object"),
+])
+def test_invalid_config(data, error):
+    with pytest.raises(ValueError, match=error):
+        parse_routing_config(data)
+
+
+def test_same_triggers_share_a_matcher():
+    chats = {-1: {"quiet_hours": [22, 7]}, -2: {"to_boss": ["x"]}, -3: {"to_boss": ["x"]}}
+    table = build_routing({}, ["plan"], ["yang"], 1, 2, chat_routes=chats)
+    assert table.rules_for(-1).matcher is table.default.matcher
+    assert table.rules_for(-2).matcher is table.rules_for(-3).matcher
+
+
+def test_reload_keeps_previous_table_on_bad_file(bot_app, loop):
+    bot = bot_app[0]
+    path = bot.ROUTING_FILE
+    try:
+        write(path, {"to_boss": ["deploy"]}, 10)
+        table = loop.run_until_complete(bot.reload_routing())
+        assert bot.routing is table and bot.routing_mtime == 10
+        assert triggers(bot.routing, -1, "deploy now") == ["deploy"]
+
+        for n, broken in enumerate(['{"to_boss": ["deploy"', {"to_boss": 5}], start=11):
+            write(path, broken, n)
+            with pytest.raises(ValueError):
+                loop.run_until_complete(bot.reload_routing())
+            assert bot.routing is table
+            # The watcher doesn't retry a broken file until it changes again
+            assert bot.routing_mtime == n
+            loop.run_until_complete(bot.routing_watch_job(None))
+            assert bot.routing is table
+
+        # Fixed on disk: the watcher picks it up
+        write(path, {"to_boss": ["rollback"]}, 20)
+        loop.run_until_complete(bot.routing_watch_job(None))
+        assert bot.routing is not table
+        assert triggers(bot.routing, -1, "deploy or rollback") == ["rollback"]
+    finally:
+        os.remove(path)
+        loop.run_until_complete(bot.reload_routing())
+    assert bot.routing_mtime is None
+    assert "production" in triggers(bot.routing, -1, "production")
@@ -0,0 +1,36 @@
+from app.storage import AlertStore
+
+
+def _entry(**kw):
+    entry = {
+        "group_id": -100123,
+        "group_title": "Ops",
+        "group_username": None,
+        "message_id": 7,
+        "text": "production is down again",
+        "sender": "Ann",
+        "time": "2026-01-02T10:00:00",
+        "status": "pending",
+        "burst": None,
+        "dest": 42,
+        "thread_id": None,
+    }
+    entry.update(kw)
+    return entry
+
+
+def test_search_returns_hits(tmp_path):
+    store = AlertStore(str(tmp_path / "alerts.db"), search_path=str(tmp_path / "search.db"))
+    try:
+        store.write_batch({"-100123_7": _entry(), "-100123_8": _entry(message_id=8, text="lunch?")})
+        total, results = store.search("production")
+    finally:
+        store.close()
+
+    assert total == 1
+    hit = results[0]
+    assert hit["key"] == "-100123_7"
+    assert hit["group_title"] == "Ops"
+    assert hit["status"] == "pending"
+    assert "production" in hit["text"]
+    assert hit["archived"] is False
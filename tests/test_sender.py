@@ -0,0 +1,183 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+from app import sender as sender_module
+from app.sender import PRIORITY_BOSS, PRIORITY_DIGEST, PRIORITY_GROUP, SendQueue, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeBot:
+    """Records sends; `fail` maps a text to the errors its next sends raise."""
+
+    def __init__(self):
+        self.sent = []
+        self.fail = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        errors = self.fail.get(text)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(chat_id=chat_id, text=text)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sender_module, "time", clock)
+    return clock
+
+
+async def step(queue, n=1):
+    """Let the queue handle its next `n` items, without worker tasks."""
+    for _ in range(n):
+        item = queue._queue.get_nowait()
+        try:
+            await queue._process(item)
+        finally:
+            queue._queue.task_done()
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    for _ in range(3):
+        assert bucket.delay(clock.now) == 0
+        bucket.take(clock.now)
+    assert bucket.delay(clock.now) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.delay(clock.now) == 0
+    # Never refills past capacity
+    clock.now += 60
+    bucket.take(clock.now)
+    assert bucket.tokens == pytest.approx(2)
+
+
+def test_priority_order(clock):
+    bot = FakeBot()
+
+    async def run():
+        queue = SendQueue(workers=1)
+        queue.send_message(bot, 1, "digest", PRIORITY_DIGEST)
+        queue.send_message(bot, 2, "group", PRIORITY_GROUP)
+        queue.send_message(bot, 3, "boss", PRIORITY_BOSS)
+        queue.send_message(bot, 4, "boss 2", PRIORITY_BOSS)
+        await step(queue, 4)
+
+    asyncio.run(run())
+    assert [text for _, text in bot.sent] == ["boss", "boss 2", "group", "digest"]
+
+
+def test_chat_bucket_defers_busy_chat_only(clock):
+    bot = FakeBot()
+
+    async def run():
+        queue = SendQueue(global_rate=100, chat_rate=1.0, chat_burst=3)
+        for n in range(4):
+            queue.send_message(bot, 1, f"a{n}")
+        queue.send_message(bot, 2, "b0")
+        await step(queue, 5)
+        # The fourth send to chat 1 waits for a token; chat 2 isn't held up
+        assert queue.stats()["deferred"] == 1
+        assert queue.depth() == 1
+        assert queue._wait_time(1, clock.now) == pytest.approx(1.0)
+        clock.now += 1.0
+        assert queue._wait_time(1, clock.now) == 0
+
+    asyncio.run(run())
+    assert bot.sent == [(1, "a0"), (1, "a1"), (1, "a2"), (2, "b0")]
+
+
+def test_global_bucket_waits(clock, monkeypatch):
+    bot = FakeBot()
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        clock.now += seconds
+
+    async def run():
+        queue = SendQueue(global_rate=2, chat_rate=10, chat_burst=10)
+        for chat_id in range(3):
+            queue.send_message(bot, chat_id, "x")
+        monkeypatch.setattr(sender_module.asyncio, "sleep", sleep)
+        await step(queue, 3)
+
+    asyncio.run(run())
+    assert len(bot.sent) == 3
+    assert slept == [pytest.approx(0.5)]
+
+
+def test_retry_after_pauses_chat(clock):
+    bot = FakeBot()
+    bot.fail["slow"] = [RetryAfter(0.05)]
+
+    async def run():
+        queue = SendQueue(global_rate=100, chat_rate=100, chat_burst=100)
+        first = queue.send_message(bot, 1, "slow")
+        await step(queue)
+        assert queue.flood_waits == 1
+        assert queue._wait_time(1, clock.now) == pytest.approx(0.05)
+
+        # Other sends to the paused chat wait too; other chats don't
+        queue.send_message(bot, 1, "later")
+        queue.send_message(bot, 2, "other")
+        await step(queue, 2)
+        assert bot.sent == [(2, "other")]
+
+        clock.now += 0.05
+        await asyncio.sleep(0.1)  # the deferred items are requeued
+        await step(queue, 2)
+        assert (await first).text == "slow"
+        return queue
+
+    queue = asyncio.run(run())
+    assert sorted(bot.sent) == [(1, "later"), (1, "slow"), (2, "other")]
+    assert queue.retried == 1 and queue.dropped == 0
+
+
+def test_bad_request_is_not_retried(clock):
+    bot = FakeBot()
+    bot.fail["bad"] = [BadRequest("Chat not found")]
+
+    async def run():
+        queue = SendQueue()
+        bad = queue.send_message(bot, 1, "bad")
+        await step(queue)
+        with pytest.raises(BadRequest):
+            await bad
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.dropped == 1 and queue.retried == 0 and queue.depth() == 0
+
+
+def test_timeouts_retried_up_to_max_attempts(clock):
+    bot = FakeBot()
+    bot.fail["flaky"] = [TimedOut()]
+    bot.fail["dead"] = [TimedOut()]
+
+    async def run():
+        queue = SendQueue(max_attempts=2)
+        queue.send_message(bot, 1, "flaky")
+        await step(queue)
+        assert queue.retried == 1 and queue._deferred == 1
+
+        queue.max_attempts = 1
+        dead = queue.send_message(bot, 2, "dead")
+        await step(queue)
+        with pytest.raises(TimedOut):
+            await dead
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.dropped == 1
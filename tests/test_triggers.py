@@ -0,0 +1,72 @@
+from app.triggers import PRIORITY_BOSS, PRIORITY_GROUP, TriggerMatcher
+
+
+def words(matcher, text):
+    return sorted(t.word for t in matcher.match(text))
+
+
+def test_word_boundaries():
+    m = TriggerMatcher(to_boss=["you"], word_boundary=True)
+    assert words(m, "see you tomorrow") == ["you"]
+    assert words(m, "you.") == ["you"]
+    assert words(m, "is this your plan") == []
+    assert words(m, "thankyou") == []
+
+
+def test_substrings_without_word_boundaries():
+    m = TriggerMatcher(to_boss=["you"])
+    assert words(m, "is this your plan") == ["you"]
+
+
+def test_trigger_that_is_a_prefix_of_another():
+    m = TriggerMatcher(to_boss=["longdy", "longdy_seng"], word_boundary=True)
+    # "longdy" is followed by "_", so it isn't a word of its own here
+    assert words(m, "ask longdy_seng") == ["longdy_seng"]
+    assert words(m, "ask longdy now") == ["longdy"]
+
+    m = TriggerMatcher(to_boss=["longdy", "longdy_seng"])
+    assert words(m, "ask longdy_seng") == ["longdy", "longdy_seng"]
+
+
+def test_prefix_with_non_word_end():
+    # "@longdy_seng" contains "longdy_seng", and both end in a word character
+    m = TriggerMatcher(to_boss=["@longdy_seng", "longdy_seng"], word_boundary=True)
+    assert words(m, "hi @longdy_seng!") == ["@longdy_seng", "longdy_seng"]
+    assert words(m, "hi @longdy_sengs") == []
+
+
+def test_casefold_and_unicode():
+    m = TriggerMatcher(to_boss=["straße", "ПЛАН"], casefold=True)
+    assert words(m, "STRASSE 5") == ["straße"]
+    assert words(m, "новый план") == ["ПЛАН"]
+
+    m = TriggerMatcher(to_boss=["straße"])
+    assert words(m, "STRASSE 5") == []
+    assert words(m, "Straße 5") == ["straße"]
+
+
+def test_regex_metacharacters_are_literal():
+    m = TriggerMatcher(to_boss=["c++", "a.b", "(urgent)", "$5"], word_boundary=True)
+    assert words(m, "we use c++ here") == ["c++"]
+    assert words(m, "axb") == []
+    assert words(m, "a.b") == ["a.b"]
+    assert words(m, "this is (urgent)") == ["(urgent)"]
+    assert words(m, "costs $5") == ["$5"]
+    assert words(m, "urgent") == []
+
+
+def test_priority_order_and_shared_words():
+    m = TriggerMatcher(
+        routes={"deploy": {"chat_id": 1}},
+        to_boss=["plan", "deploy"],
+        to_group=["yang"],
+    )
+    hits = m.match("yang: deploy the plan")
+    assert hits[0] == ("deploy", "route", 0, {"chat_id": 1})
+    assert sorted(t.word for t in hits[1:3]) == ["deploy", "plan"]
+    assert [t.priority for t in hits[1:]] == [PRIORITY_BOSS, PRIORITY_BOSS, PRIORITY_GROUP]
+    assert hits[3].word == "yang"
+
+def test_empty():
+    assert TriggerMatcher().match("anything") == []
+    assert TriggerMatcher(to_boss=["plan"]).match("") == []
@@ -0,0 +1,105 @@
+import json
+
+from app import ttlmap
+from app.ttlmap import TTLMap, load_snapshot, snapshot_maps, write_snapshot
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def test_entries_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttlmap.time, "time", clock.time)
+    m = TTLMap(ttl=60)
+    m["a"] = 1
+    m.set("b", 2, ttl=10)
+
+    clock.now += 30
+    assert "b" not in m
+    assert m["a"] == 1
+    assert m.get("b", "gone") == "gone"
+
+    clock.now += 31
+    assert m.expire() == 1
+    assert len(m) == 0
+
+
+def test_expire_skips_overwritten_deadlines():
+    m = TTLMap(ttl=60)
+    m.set("a", 1, now=0)
+    m.set("a", 2, now=100)  # pushes the deadline out to 160
+    assert m.expire(now=100) == 0
+    assert len(m) == 1
+    assert m.expire(now=160) == 1
+    assert len(m) == 0
+
+
+def test_max_size_evicts_soonest_to_expire():
+    m = TTLMap(ttl=60, max_size=3)
+    m.set("long", 1, ttl=300, now=0)
+    m.set("short", 2, ttl=10, now=0)
+    m.set("mid", 3, ttl=100, now=0)
+    m.set("new", 4, ttl=200, now=0)
+    assert sorted(m._data) == ["long", "mid", "new"]
+    m.set("newer", 5, ttl=150, now=0)
+    assert sorted(m._data) == ["long", "new", "newer"]
+    # An entry that would expire first is the one to go, even if it is new
+    m.set("newest", 6, ttl=50, now=0)
+    assert sorted(m._data) == ["long", "new", "newer"]
+
+
+def test_delete_and_pop():
+    m = TTLMap(ttl=60)
+    m["a"] = 1
+    assert m.pop("a") == 1
+    assert m.pop("a", "none") == "none"
+    m["b"] = 2
+    del m["b"]
+    assert "b" not in m
+
+
+def test_snapshot_round_trip(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttlmap.time, "time", clock.time)
+    path = str(tmp_path / "state.json")
+    replies, follow = TTLMap(ttl=600), TTLMap(ttl=60)
+    replies.set(1000, "-100_5")
+    replies.set(1001, "-100_6", ttl=30)
+    follow.set("-100:7", {"dest": 1000})
+    assert replies.dirty
+
+    data = snapshot_maps({"reply_map": replies, "media_follow": follow})
+    assert not replies.dirty and not follow.dirty
+    write_snapshot(path, data)
+    # JSON keeps deadlines as wall-clock timestamps
+    with open(path) as f:
+        assert json.load(f)["reply_map"][0] == [1000, "-100_5", clock.now + 600]
+
+    # Restart 45 seconds later: the 30 s entry is gone, the others keep their
+    # original deadlines rather than getting a fresh TTL
+    clock.now += 45
+    replies, follow = TTLMap(ttl=600), TTLMap(ttl=60)
+    load_snapshot(path, {"reply_map": replies, "media_follow": follow})
+    assert not replies.dirty
+    assert replies.get(1000) == "-100_5"
+    assert 1001 not in replies
+    assert follow.get("-100:7") == {"dest": 1000}
+
+    clock.now += 15
+    assert "-100:7" not in follow
+    clock.now += 540
+    assert 1000 not in replies
+
+
+def test_missing_or_bad_snapshot(tmp_path):
+    m = TTLMap(ttl=60)
+    load_snapshot(str(tmp_path / "missing.json"), {"m": m})
+    bad = tmp_path / "bad.json"
+    bad.write_text("{not json")
+    load_snapshot(str(bad), {"m": m})
+    assert len(m) == 0